@@ -1,141 +1,446 @@
+import asyncio
+import hashlib
 import json
 import time
-from typing import AsyncGenerator, Optional
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Tuple
 import httpx
+from app.cache import LRUCache
 from app.config import settings
 from app.models import (
     ChatCompletionRequest, ChatCompletionResponse, ChatCompletionResponseChoice,
-    ChatMessage, ADKRunRequest, ADKMessage, ADKPart, ListModelsResponse, ModelInfo
+    ChatMessage, ADKRunRequest, ADKMessage, ADKPart, ListModelsResponse, ModelInfo, Usage
 )
+from app import delta
+from app.admission import AdmissionController
+from app.backends import Backend, BackendPool
+from app.delta import StreamDeltaTracker
+from app.errors import ADKRunError, ADKUnavailableError
 from app.multimodal import MultimodalProcessor
+from app.resilience import RetryPolicy
+from app import metrics, serialization, streaming
+from app.serialization import ChunkEncoder
+from app.logging_config import redacted
 import logging
 
 logger = logging.getLogger(__name__)
 
+# /run 响应体超过该大小时边接收边解析，只保留最后一个事件
+INCREMENTAL_PARSE_MIN_BYTES = 256 * 1024
+
 
 class ADKClient:
     def __init__(self):
-        self.adk_host = settings.adk_host
         self.default_app_name = settings.adk_app_name
         self.multimodal_processor = MultimodalProcessor()
-        self._session_cache = set()  # Simple cache for created sessions
-        self._content_cache = {}  # Cache to track sent content for deduplication
-        self._event_cache = set()  # Cache to track processed events for deduplication
+        self._http_client: Optional[httpx.AsyncClient] = None  # Shared pooled client for ADK traffic
+        self._http_client_http2 = False
+        # Bounded registry of sessions known to exist on the ADK backend
+        self._session_cache = LRUCache(
+            max_size=settings.session_cache_max_size,
+            ttl=settings.session_cache_ttl
+        )
+        self._session_inflight: Dict[str, asyncio.Future] = {}  # Session creations in progress
+        self.retry_policy = RetryPolicy(
+            max_attempts=settings.adk_retry_max_attempts,
+            base_delay=settings.adk_retry_base_delay,
+            max_delay=settings.adk_retry_max_delay
+        )
+        # ADK replicas; each has its own circuit breaker
+        self.backends = BackendPool(
+            settings.adk_hosts,
+            strategy=settings.adk_routing_strategy,
+            failure_threshold=settings.adk_circuit_failure_threshold,
+            reset_timeout=settings.adk_circuit_reset_timeout,
+            health_check_path=settings.adk_health_check_path
+        )
+        self._health_check_task: Optional[asyncio.Task] = None
+        self.admission = AdmissionController(
+            max_in_flight=settings.adk_max_in_flight_per_app,
+            max_queue=settings.adk_max_queue_per_app,
+            queue_timeout=settings.adk_queue_timeout,
+            retry_after=settings.adk_retry_after
+        )
+        # ADK sessions are stateful: runs of one session go one at a time, in arrival order
+        self.session_queue = AdmissionController(
+            max_in_flight=1 if settings.session_serialize_runs else 0,
+            max_queue=settings.session_queue_max_depth,
+            queue_timeout=settings.session_queue_timeout,
+            retry_after=settings.adk_retry_after,
+            scope="session"
+        )
+        
+    async def start(self):
+        """Create the shared HTTP client used for all ADK backend calls."""
+        if self._http_client is None:
+            self._http_client = self._build_http_client()
+            logger.info(
+                "ADK HTTP client started (max_connections=%s, keepalive=%s, http2=%s)",
+                settings.adk_max_connections, settings.adk_max_keepalive_connections, self._http_client_http2
+            )
+        if len(self.backends.backends) > 1 and settings.adk_health_check_interval > 0 and self._health_check_task is None:
+            self._health_check_task = asyncio.create_task(self.backends.run_health_checks(
+                self.http_client, settings.adk_health_check_interval, settings.adk_connect_timeout
+            ))
+    
+    async def close(self):
+        """Close the shared HTTP client and release pooled connections."""
+        if self._health_check_task is not None:
+            self._health_check_task.cancel()
+            self._health_check_task = None
+        if self._http_client is not None:
+            client, self._http_client = self._http_client, None
+            await client.aclose()
+            logger.info("ADK HTTP client closed")
+    
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Shared HTTP client, created lazily if `start()` was not called."""
+        if self._http_client is None:
+            self._http_client = self._build_http_client()
+        return self._http_client
+    
+    def _build_http_client(self) -> httpx.AsyncClient:
+        """Build a pooled AsyncClient configured from settings."""
+        http2 = settings.adk_http2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("ADK_HTTP2 is enabled but the 'h2' package is not installed, falling back to HTTP/1.1")
+                http2 = False
+        self._http_client_http2 = http2
+        
+        limits = httpx.Limits(
+            max_connections=settings.adk_max_connections,
+            max_keepalive_connections=settings.adk_max_keepalive_connections,
+            keepalive_expiry=settings.adk_keepalive_expiry
+        )
+        timeout = httpx.Timeout(settings.adk_run_timeout, connect=settings.adk_connect_timeout)
+        return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2)
+    
+    def session_cache_stats(self) -> dict:
+        """Size and hit-ratio counters of the session registry."""
+        return self._session_cache.stats()
+    
+    def _timeout(self, total: float) -> httpx.Timeout:
+        """Per-operation timeout sharing the configured connect timeout."""
+        return httpx.Timeout(total, connect=settings.adk_connect_timeout)
         
-    async def create_chat_completion(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
+    async def create_chat_completion(self, request: ChatCompletionRequest,
+                                     conversation_id: Optional[str] = None) -> ChatCompletionResponse:
         """Create a non-streaming chat completion."""
-        adk_request = await self._convert_to_adk_request(request)
+        started = time.perf_counter()
+        adk_request = await self._convert_to_adk_request(request, conversation_id)
+        
+        backend = self._select_backend(adk_request)
         
         # Ensure session exists before running
-        await self._ensure_session(adk_request.appName, adk_request.userId, adk_request.sessionId)
+        await self._ensure_session(backend, adk_request.appName, adk_request.userId, adk_request.sessionId)
         
         # Log the request for debugging
         request_data = adk_request.to_adk_format()
-        logger.info(f"Sending ADK request to {self.adk_host}/run")
-        logger.debug(f"Request data: {request_data}")
+        logger.debug("Sending ADK request to %s/run", backend.url)
+        logger.debug("Request data: %s", redacted(request_data))
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"{self.adk_host}/run",
-                    json=request_data
-                )
-                logger.info(f"ADK response status: {response.status_code}")
-                response.raise_for_status()
-                
-                adk_response = response.json()
-                return self._convert_from_adk_response(adk_response, request.model)
+            # Wait for the session before taking an app slot, so queued turns don't hold one
+            async with self.session_queue.slot(self._run_key(adk_request)), self.admission.slot(adk_request.appName):
+                with self.backends.track(backend):
+                    response = await self._send_run(backend, adk_request, request_data, stream=True)
+                    adk_response, usage = await self._read_run_events(response)
+            completion = self._convert_from_adk_response(adk_response, request.model)
+            completion.usage = usage
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, stream="false")
+            return completion
                 
+        except ADKUnavailableError as e:
+            metrics.ERRORS.inc(status=e.status_code)
+            raise
         except httpx.HTTPStatusError as e:
-            logger.error(f"ADK HTTP error: {e.response.status_code} - {e.response.text}")
+            metrics.ERRORS.inc(status=e.response.status_code)
+            logger.error("ADK HTTP error: %s - %s", e.response.status_code, e.response.text)
             raise
         except Exception as e:
-            logger.error(f"Error calling ADK: {e}")
+            metrics.ERRORS.inc(status="exception")
+            logger.error("Error calling ADK: %s", e)
             raise
     
-    async def create_chat_completion_stream(self, request: ChatCompletionRequest) -> AsyncGenerator[str, None]:
-        """Create a streaming chat completion using non-streaming ADK endpoint."""
-        adk_request = await self._convert_to_adk_request(request)
-        adk_request.streaming = False  # Use non-streaming endpoint
+    async def create_chat_completion_stream(self, request: ChatCompletionRequest,
+                                            conversation_id: Optional[str] = None) -> AsyncGenerator[str, None]:
+        """Create a streaming chat completion, forwarding ADK events as they arrive."""
+        started = time.perf_counter()
+        first_token = True
+        adk_request = await self._convert_to_adk_request(request, conversation_id)
+        adk_request.streaming = settings.adk_token_streaming
+        
+        backend = self._select_backend(adk_request)
         
         # Ensure session exists before running
-        await self._ensure_session(adk_request.appName, adk_request.userId, adk_request.sessionId)
+        await self._ensure_session(backend, adk_request.appName, adk_request.userId, adk_request.sessionId)
         
-        # Log the request for debugging
-        request_data = adk_request.to_adk_format()
-        logger.info(f"Sending ADK request to {self.adk_host}/run (non-streaming)")
-        logger.debug(f"Request data: {request_data}")
+        encoder = ChunkEncoder(request.model)
+        # Batch small deltas into fewer SSE frames, keep idle connections alive.
+        # Keep-alives only start once ADK has accepted the run: until then a
+        # queue timeout or ADK error can still be answered with a proper status.
+        run_started = asyncio.Event()
+        deltas = streaming.coalesce(
+            self._stream_deltas(backend, adk_request, request.model, run_started),
+            max_bytes=settings.stream_coalesce_max_bytes,
+            max_delay=settings.stream_coalesce_max_delay,
+            keepalive_interval=settings.stream_keepalive_interval,
+            keepalive_after=run_started
+        )
         
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"{self.adk_host}/run",
-                    json=request_data
-                )
-                logger.info(f"ADK response status: {response.status_code}")
-                response.raise_for_status()
-                
-                adk_response = response.json()
-                logger.info(f"ADK response received: {type(adk_response)}")
-                
-                # Convert ADK response to OpenAI format
-                openai_response = self._convert_from_adk_response(adk_response, request.model)
-                
-                if openai_response.choices and openai_response.choices[0].message.content:
-                    content = openai_response.choices[0].message.content
-                    
-                    # Simulate streaming by sending content in chunks
-                    chunk_size = 10  # Send 10 characters at a time
-                    for i in range(0, len(content), chunk_size):
-                        chunk_content = content[i:i + chunk_size]
-                        
-                        # Create OpenAI streaming chunk
-                        chunk = {
-                            "id": f"chatcmpl-{int(time.time())}",
-                            "object": "chat.completion.chunk",
-                            "created": int(time.time()),
-                            "model": request.model,
-                            "choices": [
-                                {
-                                    "index": 0,
-                                    "delta": {"content": chunk_content},
-                                    "finish_reason": None
-                                }
-                            ]
-                        }
-                        
-                        yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
-                        
-                        # Small delay to simulate streaming
-                        import asyncio
-                        await asyncio.sleep(0.05)
-                    
-                    # Send final chunk with finish_reason
-                    final_chunk = {
-                        "id": f"chatcmpl-{int(time.time())}",
-                        "object": "chat.completion.chunk",
-                        "created": int(time.time()),
-                        "model": request.model,
-                        "choices": [
-                            {
-                                "index": 0,
-                                "delta": {},
-                                "finish_reason": "stop"
-                            }
-                        ]
-                    }
-                    
-                    yield f"data: {json.dumps(final_chunk, ensure_ascii=False)}\n\n"
-                
-                # Send final [DONE] message
-                yield "data: [DONE]\n\n"
+            async for content in deltas:
+                if content is None:
+                    yield serialization.SSE_KEEPALIVE
+                    continue
+                if first_token:
+                    first_token = False
+                    metrics.TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started)
+                yield encoder.delta(content)
+            
+            # Send final chunk with finish_reason
+            yield encoder.finish("stop")
+            
+            # Send final [DONE] message
+            yield serialization.SSE_DONE
+            metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, stream="true")
                 
+        except ADKUnavailableError as e:
+            metrics.ERRORS.inc(status=e.status_code)
+            raise
+        except ADKRunError:
+            metrics.ERRORS.inc(status=502)
+            raise
         except httpx.HTTPStatusError as e:
-            logger.error(f"ADK HTTP error: {e.response.status_code} - {e.response.text}")
+            metrics.ERRORS.inc(status=e.response.status_code)
+            logger.error("ADK HTTP error: %s - %s", e.response.status_code, e.response.text)
             raise
         except Exception as e:
-            logger.error(f"Error in ADK call: {e}")
+            metrics.ERRORS.inc(status="exception")
+            logger.error("Error in ADK call: %s", e)
             raise
+        finally:
+            await deltas.aclose()
+    
+    async def _stream_deltas(self, backend: Backend, adk_request: ADKRunRequest, model: str,
+                             run_started: asyncio.Event) -> AsyncGenerator[str, None]:
+        """Run the agent and yield the new text of each ADK event; sets `run_started` once ADK answered."""
+        request_data = adk_request.to_adk_format()
+        tracker = StreamDeltaTracker()
+        
+        async with self.session_queue.slot(self._run_key(adk_request)), self.admission.slot(adk_request.appName):
+            with self.backends.track(backend):
+                if settings.adk_stream_mode == "sse":
+                    logger.debug("Sending ADK request to %s/run_sse", backend.url)
+                    logger.debug("Request data: %s", redacted(request_data))
+                    
+                    response = await self._send_run(backend, adk_request, request_data, path="/run_sse", stream=True)
+                    run_started.set()
+                    try:
+                        async for adk_event in self._iter_sse_events(response):
+                            new_content = self._convert_adk_event_to_delta(adk_event, tracker)
+                            if new_content:
+                                yield new_content
+                    finally:
+                        await response.aclose()
+                else:
+                    logger.debug("Sending ADK request to %s/run (non-streaming)", backend.url)
+                    logger.debug("Request data: %s", redacted(request_data))
+                    
+                    response = await self._send_run(backend, adk_request, request_data, stream=True)
+                    run_started.set()
+                    adk_response, _ = await self._read_run_events(response)
+                    
+                    # Forward the complete answer as a single delta
+                    openai_response = self._convert_from_adk_response(adk_response, model)
+                    if openai_response.choices and openai_response.choices[0].message.content:
+                        yield openai_response.choices[0].message.content
+    
+    async def _send_run(self, backend: Backend, adk_request: ADKRunRequest, request_data: dict,
+                        path: str = "/run", stream: bool = False) -> httpx.Response:
+        """
+        POST a run request to ADK, re-creating the session and retrying once if
+        the backend no longer knows it (e.g. after an ADK restart). Transient
+        failures are retried per the retry policy (see `_send_with_retry`).
+        
+        With `stream=True` the caller owns the returned response and must close it.
+        """
+        body = serialization.dumps(request_data)
+        for attempt in range(2):
+            response = await self._send_with_retry(
+                backend,
+                "run",
+                lambda: self.http_client.build_request(
+                    "POST",
+                    f"{backend.url}{path}",
+                    content=body,
+                    headers=serialization.JSON_HEADERS,
+                    timeout=self._timeout(settings.adk_run_timeout)
+                ),
+                metrics.ADK_RUN_LATENCY, {"path": path},
+                stream=stream
+            )
+            logger.debug("ADK response status: %s", response.status_code)
+            if not response.is_error:
+                return response
+            
+            if stream:
+                await response.aread()
+                await response.aclose()
+            
+            if attempt == 0 and self._is_session_missing(response):
+                logger.warning("ADK session %s not found, re-creating and retrying", adk_request.sessionId)
+                self._session_cache.discard(
+                    self._session_key(backend, adk_request.appName, adk_request.userId, adk_request.sessionId)
+                )
+                await self._ensure_session(backend, adk_request.appName, adk_request.userId, adk_request.sessionId)
+                continue
+            
+            response.raise_for_status()
+    
+    async def _send_with_retry(self, backend: Backend, operation: str, build_request: Callable[[], httpx.Request],
+                               histogram: metrics.Histogram, labels: dict,
+                               stream: bool = False, idempotent: bool = False) -> httpx.Response:
+        """
+        Send a request through the backend's circuit breaker, retrying failures the retry
+        policy considers safe with jittered exponential backoff.
+        
+        Returns the last response, which may still be an error response.
+        
+        The breaker counts one failure per call, once its retries are used up,
+        so a single request retrying through an outage cannot open the circuit
+        on its own. A failed half-open probe is counted at once, re-opening it.
+        """
+        attempt = 0
+        breaker = backend.circuit_breaker
+        while True:
+            breaker.before_call()
+            try:
+                with histogram.time(**labels):
+                    response = await self.http_client.send(build_request(), stream=stream)
+            except httpx.TransportError as e:
+                retry = self.retry_policy.should_retry_error(e, attempt, idempotent)
+                # Local pool exhaustion says nothing about ADK's health
+                if not isinstance(e, httpx.PoolTimeout) and (not retry or breaker.state == breaker.HALF_OPEN):
+                    breaker.record_failure()
+                if not retry:
+                    raise
+                logger.warning("ADK %s failed (%s: %s), retrying", operation, type(e).__name__, e)
+            else:
+                retry = self.retry_policy.should_retry_status(response.status_code, attempt, idempotent)
+                if response.status_code < 500:
+                    breaker.record_success()
+                elif not retry or breaker.state == breaker.HALF_OPEN:
+                    breaker.record_failure()
+                if not retry:
+                    return response
+                if stream:
+                    await response.aclose()
+                logger.warning("ADK %s returned %s, retrying", operation, response.status_code)
+            
+            metrics.ADK_RETRIES.inc(operation=operation)
+            await asyncio.sleep(self.retry_policy.delay(attempt))
+            attempt += 1
+    
+    async def _read_run_events(self, response: httpx.Response) -> Tuple[Any, Optional[Usage]]:
+        """
+        Parse a /run response while it is received and close it.
+        
+        Tool-heavy runs return long event lists of which only the last event
+        (the final answer) is converted, so every other event is dropped as
+        soon as it has been parsed and only its token usage is kept. Small
+        bodies are parsed in one go, which is faster.
+        Returns: (response to convert, summed usage or None)
+        """
+        content_length = response.headers.get("content-length", "")
+        last_event = None
+        usage: Optional[Usage] = None
+        event_count = 0
+        
+        def consume(events: list):
+            nonlocal last_event, usage, event_count
+            for event in events:
+                event_count += 1
+                last_event = event
+                usage = self._add_usage(usage, event)
+        
+        try:
+            if content_length.isdigit() and int(content_length) < INCREMENTAL_PARSE_MIN_BYTES:
+                adk_response = serialization.loads(await response.aread())
+                is_array = isinstance(adk_response, list)
+                consume(adk_response if is_array else [adk_response])
+            else:
+                parser = serialization.JSONArrayParser()
+                async for chunk in response.aiter_bytes():
+                    consume(parser.feed(chunk))
+                consume(parser.close())
+                is_array = parser.is_array
+        finally:
+            await response.aclose()
+        
+        if not is_array:
+            return last_event, usage
+        logger.debug("ADK returned list with %s events", event_count)
+        return ([last_event] if event_count else []), usage
+    
+    def _add_usage(self, usage: Optional[Usage], adk_event: Any) -> Optional[Usage]:
+        """Add the token counts of an ADK event (`usageMetadata`) to `usage`."""
+        metadata = adk_event.get("usageMetadata") if isinstance(adk_event, dict) else None
+        if not isinstance(metadata, dict):
+            return usage
+        if usage is None:
+            usage = Usage()
+        usage.prompt_tokens += metadata.get("promptTokenCount") or 0
+        usage.completion_tokens += metadata.get("candidatesTokenCount") or 0
+        usage.total_tokens += metadata.get("totalTokenCount") or 0
+        return usage
+    
+    def _is_session_missing(self, response: httpx.Response) -> bool:
+        """Whether ADK rejected a run because the session does not exist."""
+        return response.status_code == 404 and "session" in response.text.lower()
+    
+    async def _iter_sse_events(self, response: httpx.Response) -> AsyncGenerator[dict, None]:
+        """Parse an ADK Server-Sent-Events response into event dicts."""
+        data_lines = []
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                data_lines.append(line[5:].lstrip(" "))
+                continue
+            if line or not data_lines:
+                # Comments, other SSE fields, or blank lines between events
+                continue
+            
+            adk_event = self._parse_sse_payload(data_lines)
+            data_lines = []
+            if adk_event is None:
+                continue
+            yield self._check_sse_event(adk_event)
+        
+        # Flush a trailing event that was not terminated by a blank line
+        if data_lines:
+            adk_event = self._parse_sse_payload(data_lines)
+            if adk_event is not None:
+                yield self._check_sse_event(adk_event)
+    
+    def _check_sse_event(self, adk_event: dict) -> dict:
+        """Raise ADKRunError for an ADK error event instead of ending the stream as if it succeeded."""
+        if "error" in adk_event:
+            logger.error("ADK SSE error event: %s", adk_event["error"])
+            raise ADKRunError(f"ADK run failed: {adk_event['error']}")
+        return adk_event
+    
+    def _parse_sse_payload(self, data_lines: list) -> Optional[dict]:
+        """Decode the joined `data:` lines of one SSE event."""
+        payload = "\n".join(data_lines)
+        try:
+            adk_event = serialization.loads(payload)
+        except ValueError:
+            logger.warning("Skipping malformed ADK SSE payload: %s...", payload[:100])
+            return None
+        return adk_event if isinstance(adk_event, dict) else None
     
     async def list_models(self) -> ListModelsResponse:
         """List available models (ADK agents)."""
@@ -149,7 +454,8 @@ class ADKClient:
         
         return ListModelsResponse(data=[model])
     
-    async def _convert_to_adk_request(self, request: ChatCompletionRequest) -> ADKRunRequest:
+    async def _convert_to_adk_request(self, request: ChatCompletionRequest,
+                                      conversation_id: Optional[str] = None) -> ADKRunRequest:
         """Convert OpenAI request to ADK request format."""
         # Extract the last user message (ADK is stateful)
         last_message = request.messages[-1] if request.messages else None
@@ -157,30 +463,29 @@ class ADKClient:
         if not last_message or last_message.role != "user":
             raise ValueError("Last message must be from user")
         
-        # Generate session ID from user field
         user_id = request.user or "anonymous"
-        session_id = f"session_{user_id}"
+        session_id = self._session_id(request, user_id, conversation_id)
         
         # Process content (handle multimodal)
         if isinstance(last_message.content, str):
             # Simple text content
-            logger.info(f"Processing simple text content: {last_message.content[:100]}...")
+            logger.debug("Processing simple text content: %s...", last_message.content[:100])
             adk_parts = [ADKPart(text=last_message.content)]
         else:
             # Multimodal content
-            logger.info(f"Processing multimodal content with {len(last_message.content)} parts")
+            logger.debug("Processing multimodal content with %s parts", len(last_message.content))
             for i, part in enumerate(last_message.content):
-                logger.info(f"Part {i}: type={part.type}, content={str(part)[:100]}...")
+                logger.debug("Part %s: type=%s", i, part.type)
             
             _, adk_parts = await self.multimodal_processor.process_content(last_message.content)
-            logger.info(f"Processed into {len(adk_parts)} ADK parts")
+            logger.debug("Processed into %s ADK parts", len(adk_parts))
             for i, part in enumerate(adk_parts):
                 if part.text:
-                    logger.info(f"ADK Part {i}: text={part.text[:100]}...")
+                    logger.debug("ADK Part %s: text=%s...", i, part.text[:100])
                 elif part.inlineData:
-                    logger.info(f"ADK Part {i}: inlineData mimeType={part.inlineData.mimeType}, dataLength={len(part.inlineData.data)}")
+                    logger.debug("ADK Part %s: inlineData mimeType=%s, dataLength=%s", i, part.inlineData.mimeType, len(part.inlineData.data))
                 else:
-                    logger.info(f"ADK Part {i}: {part}")
+                    logger.debug("ADK Part %s: %s", i, part)
         
         # Create ADK message
         adk_message = ADKMessage(
@@ -199,22 +504,61 @@ class ADKClient:
         
         return adk_request
     
+    def _session_id(self, request: ChatCompletionRequest, user_id: str, conversation_id: Optional[str]) -> str:
+        """
+        ADK session for this request.
+        
+        With `session_scope=conversation` a request that names its
+        conversation (header, then `metadata.conversation_id`) gets a session
+        of its own; the id is a hash of the user and the conversation, so no
+        mapping has to be stored and it survives restarts. Without a
+        conversation id the user's single session is used, since ADK keeps the
+        history and only the last message is forwarded.
+        `session_id_from_first_message` opts into identifying a conversation by
+        its first user message instead; that only works when clients resend
+        the full history on every turn.
+        """
+        if settings.session_scope == "user":
+            return f"session_{user_id}"
+        
+        if not conversation_id and request.metadata:
+            conversation_id = request.metadata.get("conversation_id")
+        if conversation_id:
+            conversation_key = f"id:{conversation_id}"
+        elif settings.session_id_from_first_message:
+            first_message = next(message for message in request.messages if message.role == "user")
+            conversation_key = f"message:{self._message_text(first_message)}"
+        else:
+            return f"session_{user_id}"
+        
+        digest = hashlib.sha256(f"{user_id}\0{conversation_key}".encode("utf-8")).hexdigest()
+        return f"conv_{digest[:32]}"
+    
+    def _message_text(self, message: ChatMessage) -> str:
+        """Text and attachment URLs of a message, used to identify a conversation."""
+        if isinstance(message.content, str):
+            return message.content
+        return "\n".join(
+            part.text if part.text is not None else (part.image_url.url if part.image_url else "")
+            for part in message.content
+        )
+    
     def _convert_from_adk_response(self, adk_response, model: str) -> ChatCompletionResponse:
         """Convert ADK response to OpenAI response format."""
-        logger.info(f"Converting ADK response of type: {type(adk_response)}")
+        logger.debug("Converting ADK response of type: %s", type(adk_response))
         
         # Handle list response (ADK may return a list of responses)
         if isinstance(adk_response, list):
-            logger.info(f"ADK returned list with {len(adk_response)} items")
+            logger.debug("ADK returned list with %s items", len(adk_response))
             if not adk_response:
                 content = ""
             else:
                 # Take the last response from the list (most complete)
                 last_response = adk_response[-1]
-                logger.info(f"Using last response: {type(last_response)}")
+                logger.debug("Using last response: %s", type(last_response))
                 return self._convert_from_adk_response(last_response, model)
         elif not isinstance(adk_response, dict):
-            logger.error(f"Unexpected ADK response type: {type(adk_response)}")
+            logger.error("Unexpected ADK response type: %s", type(adk_response))
             content = str(adk_response)
         else:
             # Extract text content from ADK response
@@ -225,16 +569,16 @@ class ADKClient:
                         content += part["text"]
             else:
                 # Try to extract content from other possible structures
-                logger.warning(f"ADK response structure: {list(adk_response.keys()) if isinstance(adk_response, dict) else 'Not a dict'}")
+                logger.warning("ADK response structure: %s", list(adk_response.keys()) if isinstance(adk_response, dict) else 'Not a dict')
                 # Fallback: try to find any text content
                 if isinstance(adk_response, dict):
                     for key, value in adk_response.items():
                         if isinstance(value, str) and len(value) > 10:
                             content = value
-                            logger.info(f"Using content from key '{key}': {content[:100]}...")
+                            logger.debug("Using content from key '%s': %s...", key, content[:100])
                             break
         
-        logger.info(f"Final extracted content: {content[:100]}... (length: {len(content)})")
+        logger.debug("Final extracted content: %s... (length: %s)", content[:100], len(content))
         
         # Create OpenAI response
         response = ChatCompletionResponse(
@@ -252,7 +596,7 @@ class ADKClient:
         
         return response
     
-    def _create_event_fingerprint(self, adk_event: dict) -> str:
+    def _create_event_fingerprint(self, adk_event: dict, content: Optional[str] = None) -> str:
         """Create a unique fingerprint for an ADK event to detect duplicates."""
         try:
             # Use event ID if available
@@ -260,19 +604,18 @@ class ADKClient:
                 return f"id:{adk_event['id']}"
             
             # Otherwise use content hash
-            content = ""
-            if "content" in adk_event and "parts" in adk_event["content"]:
-                for part in adk_event["content"]["parts"]:
-                    if "text" in part:
-                        content += part["text"]
+            if content is None:
+                content = ""
+                if "content" in adk_event and "parts" in adk_event["content"]:
+                    for part in adk_event["content"]["parts"]:
+                        if "text" in part:
+                            content += part["text"]
             
             if content:
                 # Use hash of content for fingerprint
-                import hashlib
                 return f"content:{hashlib.md5(content.encode()).hexdigest()}"
             
             # Fallback to full event hash
-            import hashlib
             event_str = json.dumps(adk_event, sort_keys=True)
             return f"event:{hashlib.md5(event_str.encode()).hexdigest()}"
             
@@ -280,49 +623,6 @@ class ADKClient:
             # Last resort: use string representation
             return str(adk_event)
 
-    def _has_significant_overlap(self, content1: str, content2: str, min_overlap: int = 10) -> bool:
-        """Check if two content strings have significant overlap."""
-        if not content1 or not content2:
-            return False
-        
-        # Find the longest common substring
-        max_overlap = 0
-        len1, len2 = len(content1), len(content2)
-        
-        # Check for overlap at different positions
-        for i in range(min(len1, len2)):
-            if content1[:i] == content2[-i:]:
-                max_overlap = max(max_overlap, i)
-            if content1[-i:] == content2[:i]:
-                max_overlap = max(max_overlap, i)
-        
-        return max_overlap >= min_overlap
-    
-    def _extract_new_content(self, current: str, previous: str) -> str:
-        """Extract only the new part of content when there's overlap."""
-        if not previous:
-            return current
-        
-        # Try to find where previous content appears in current
-        if previous in current:
-            return current[len(previous):]
-        
-        # Try to find overlap at the end
-        max_overlap = 0
-        overlap_pos = 0
-        len_prev, len_curr = len(previous), len(current)
-        
-        for i in range(1, min(len_prev, len_curr) + 1):
-            if previous[-i:] == current[:i]:
-                max_overlap = i
-                overlap_pos = i
-        
-        if max_overlap > 0:
-            return current[overlap_pos:]
-        
-        # No clear overlap, return current
-        return current
-
     def _extract_content_key(self, adk_event: dict) -> str:
         """Extract a unique key from ADK event based on content."""
         try:
@@ -335,105 +635,118 @@ class ADKClient:
         except Exception:
             return str(adk_event)
     
-    def _convert_adk_event_to_openai_chunk(self, adk_event: dict, model: str, request_key: str) -> Optional[str]:
-        """Convert ADK SSE event to OpenAI chunk format."""
+    def _convert_adk_event_to_delta(self, adk_event: dict, tracker: StreamDeltaTracker) -> Optional[str]:
+        """Extract the text of an ADK SSE event that has not been forwarded yet."""
         try:
             # Extract content from ADK event
             content = ""
             if "content" in adk_event and "parts" in adk_event["content"]:
-                for part in adk_event["content"]["parts"]:
-                    if "text" in part:
-                        content += part["text"]
+                content = "".join(part["text"] for part in adk_event["content"]["parts"] if "text" in part)
+            
+            # Skip events already processed by this stream. Partial events carry
+            # fragments that may legitimately repeat, so only complete ones count.
+            partial = bool(adk_event.get("partial"))
+            if not partial:
+                fingerprint = self._create_event_fingerprint(adk_event, content)
+                if fingerprint in tracker.seen_events:
+                    logger.debug("Skipping already processed ADK event: %s", fingerprint)
+                    metrics.STREAM_DEDUP_SKIPS.inc(reason="fingerprint")
+                    return None
+                tracker.seen_events.add(fingerprint)
             
             if not content:
                 return None
             
-            # Log content for debugging
-            logger.info(f"EXTRACTED CONTENT: {content[:100]}... (length: {len(content)})")
-            
-            # Get previous content for this request
-            previous_content = self._content_cache.get(request_key, "")
-            
-            logger.info(f"PREVIOUS CONTENT: {previous_content[:100]}... (length: {len(previous_content)})")
-            logger.info(f"CONTENT COMPARISON: current==previous? {content == previous_content}")
-            
-            # Simple and robust deduplication logic
-            new_content = ""
-            
-            if not previous_content:
-                # First message, send full content
-                new_content = content
-                logger.info(f"FIRST MESSAGE: sending {len(content)} chars")
-            elif content == previous_content:
-                # Exact duplicate, skip entirely
-                logger.warning(f"*** DUPLICATE - SKIPPING {len(content)} chars ***")
+            action, new_content = tracker.feed(content, partial)
+            logger.debug("%s: %s new chars (total: %s)", action.upper(), len(new_content), tracker.emitted_length)
+            if action == delta.DUPLICATE:
+                metrics.STREAM_DEDUP_SKIPS.inc(reason=action)
                 return None
-            elif content.startswith(previous_content):
-                # Normal extension, send only the new part
-                new_content = content[len(previous_content):]
-                logger.info(f"EXTENSION: sending {len(new_content)} new chars (total: {len(content)})")
-            elif len(content) < len(previous_content) * 0.8:
-                # Likely a fragment or old message, skip
-                logger.warning(f"*** FRAGMENT/OLD - SKIPPING {len(content)} chars (previous: {len(previous_content)}) ***")
-                return None
-            else:
-                # Content reset or different format, send full content
-                new_content = content
-                logger.warning(f"*** RESET - sending full content {len(content)} chars ***")
+            if action == delta.RESET:
+                logger.warning("*** RESET - sending %s of %s chars ***", len(new_content), len(content))
             
-            # Update cache with current complete content
-            self._content_cache[request_key] = content
-            
-            if not new_content.strip():
-                # No new content to send
+            if not new_content:
+                # No new content to send; whitespace-only deltas (e.g. "\n\n") are content
                 return None
             
-            # Create OpenAI chunk with only the new content
-            chunk = {
-                "id": f"chatcmpl-{int(time.time())}",
-                "object": "chat.completion.chunk",
-                "created": int(time.time()),
-                "model": model,
-                "choices": [
-                    {
-                        "index": 0,
-                        "delta": {"content": new_content},
-                        "finish_reason": None
-                    }
-                ]
-            }
-            
-            return json.dumps(chunk, ensure_ascii=False)
+            # Only the new content goes into the OpenAI chunk
+            return new_content
             
         except Exception as e:
-            logger.error(f"Error converting ADK event to OpenAI chunk: {e}")
+            logger.error("Error converting ADK event to OpenAI chunk: %s", e)
             return None
     
-    async def _ensure_session(self, app_name: str, user_id: str, session_id: str):
-        """Ensure session exists before running agent."""
-        session_key = f"{app_name}:{user_id}:{session_id}"
+    def _run_key(self, adk_request: ADKRunRequest) -> str:
+        """Identifies the ADK session a run belongs to."""
+        return f"{adk_request.appName}:{adk_request.userId}:{adk_request.sessionId}"
+    
+    def _select_backend(self, adk_request: ADKRunRequest) -> Backend:
+        """Route by session, so a session keeps landing on the replica that holds it."""
+        return self.backends.select(self._run_key(adk_request))
+    
+    def _session_key(self, backend: Backend, app_name: str, user_id: str, session_id: str) -> str:
+        return f"{backend.url}|{app_name}:{user_id}:{session_id}"
+    
+    async def _ensure_session(self, backend: Backend, app_name: str, user_id: str, session_id: str):
+        """
+        Ensure session exists before running agent.
         
-        if session_key in self._session_cache:
+        Concurrent callers for the same session share a single in-flight
+        creation request; its outcome (including failures) is seen by all of them.
+        """
+        session_key = self._session_key(backend, app_name, user_id, session_id)
+        
+        if self._session_cache.get(session_key):
+            metrics.SESSION_CACHE_LOOKUPS.inc(result="hit")
             return
+        metrics.SESSION_CACHE_LOOKUPS.inc(result="miss")
+        
+        task = self._session_inflight.get(session_key)
+        if task is None:
+            task = asyncio.ensure_future(self._create_session(backend, app_name, user_id, session_id, session_key))
+            self._session_inflight[session_key] = task
+            task.add_done_callback(lambda done: self._on_session_created(session_key, done))
+        else:
+            logger.debug("Waiting for in-flight creation of ADK session: %s", session_id)
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # Create session using ADK API
-                response = await client.post(
-                    f"{self.adk_host}/apps/{app_name}/users/{user_id}/sessions",
-                    json={"sessionId": session_id}
-                )
-                
-                if response.status_code in [200, 201]:
-                    logger.info(f"Created ADK session: {session_id}")
-                    self._session_cache.add(session_key)
-                elif response.status_code == 409:
-                    # Session already exists
-                    logger.info(f"ADK session already exists: {session_id}")
-                    self._session_cache.add(session_key)
-                else:
-                    logger.warning(f"Failed to create ADK session: {response.status_code}")
-                    
+            # Shield so a cancelled caller does not abort the creation for the others
+            await asyncio.shield(task)
         except Exception as e:
-            logger.error(f"Error ensuring ADK session: {e}")
-            # Don't raise here, let the main request continue
\ No newline at end of file
+            logger.error("Error ensuring ADK session: %s", e)
+            # Don't raise here, let the main request continue
+    
+    async def _create_session(self, backend: Backend, app_name: str, user_id: str, session_id: str, session_key: str):
+        """Create a session using the ADK API, raising on unexpected responses."""
+        body = serialization.dumps({"sessionId": session_id})
+        response = await self._send_with_retry(
+            backend,
+            "create_session",
+            lambda: self.http_client.build_request(
+                "POST",
+                f"{backend.url}/apps/{app_name}/users/{user_id}/sessions",
+                content=body,
+                headers=serialization.JSON_HEADERS,
+                timeout=self._timeout(settings.adk_session_timeout)
+            ),
+            metrics.SESSION_CREATE_LATENCY, {},
+            idempotent=True
+        )
+        
+        if response.status_code in [200, 201]:
+            logger.info("Created ADK session: %s", session_id)
+        elif response.status_code == 409:
+            # Session already exists
+            logger.debug("ADK session already exists: %s", session_id)
+        else:
+            response.raise_for_status()
+        
+        self._session_cache.set(session_key)
+    
+    def _on_session_created(self, session_key: str, task: asyncio.Future):
+        """Drop the finished creation from the in-flight table."""
+        if self._session_inflight.get(session_key) is task:
+            del self._session_inflight[session_key]
+        if not task.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            task.exception()
@@ -0,0 +1,107 @@
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict
+from app import metrics
+from app.errors import ADKOverloadedError, ADKQueueTimeoutError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyState:
+    __slots__ = ("in_flight", "waiters")
+    
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+
+
+class AdmissionController:
+    """
+    Bounds concurrent ADK run calls per key (an app name or a session).
+    
+    Up to `max_in_flight` calls run at once; further callers wait in a FIFO
+    queue of at most `max_queue` entries for up to `queue_timeout` seconds.
+    A full queue is rejected immediately (429) and a queue timeout fails with
+    503, both with a Retry-After hint, so overload is shed early instead of
+    piling up until ADK times out. With `max_in_flight=1` calls for a key run
+    one at a time in arrival order.
+    
+    Only keys with calls in flight are kept, so idle keys cost nothing.
+    """
+    
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float, retry_after: float,
+                 scope: str = "app"):
+        self.max_in_flight = max_in_flight  # 0 disables admission control
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.scope = scope  # What a key is, for logs and metrics
+        self._keys: Dict[str, _KeyState] = {}
+    
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        """Hold one in-flight slot for `key` for the duration of the block."""
+        if self.max_in_flight <= 0:
+            yield
+            return
+        
+        state = await self._acquire(key)
+        try:
+            yield
+        finally:
+            self._release(key, state)
+    
+    def stats(self) -> Dict[str, dict]:
+        return {
+            key: {"in_flight": state.in_flight, "queued": len(state.waiters)}
+            for key, state in self._keys.items()
+        }
+    
+    async def _acquire(self, key: str) -> _KeyState:
+        state = self._keys.get(key)
+        if state is None:
+            state = self._keys[key] = _KeyState()
+        
+        if state.in_flight < self.max_in_flight and not state.waiters:
+            state.in_flight += 1
+            return state
+        
+        if len(state.waiters) >= self.max_queue:
+            metrics.ADMISSION_REJECTIONS.inc(scope=self.scope, reason="queue_full")
+            logger.warning("ADK admission queue full for %s %s (%s in flight)", self.scope, key, state.in_flight)
+            raise ADKOverloadedError(f"Too many concurrent requests for {self.scope} {key}", self.retry_after)
+        
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        try:
+            # The slot is handed over by _release, so in_flight stays unchanged
+            await asyncio.wait_for(waiter, self.queue_timeout if self.queue_timeout > 0 else None)
+            return state
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed over just as we gave up; pass it on
+                self._release(key, state)
+            else:
+                try:
+                    state.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.ADMISSION_REJECTIONS.inc(scope=self.scope, reason="queue_timeout")
+                logger.warning("Timed out waiting for an ADK slot for %s %s", self.scope, key)
+                raise ADKQueueTimeoutError(f"Timed out waiting for {self.scope} {key}", self.retry_after) from None
+            raise
+    
+    def _release(self, key: str, state: _KeyState):
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        
+        state.in_flight -= 1
+        if not state.in_flight:
+            # Drop idle keys so the table only holds active ones
+            self._keys.pop(key, None)
@@ -0,0 +1,270 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from email.utils import parsedate_to_datetime
+import httpx
+from app.config import settings
+from app.models import ADKInlineData
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CachedAttachment:
+    """A processed attachment plus the HTTP validators needed to revalidate it."""
+    __slots__ = ("mime_type", "data", "etag", "last_modified", "expires_at")
+    
+    def __init__(self, mime_type: str, data: str, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, expires_at: float = 0):
+        self.mime_type = mime_type
+        self.data = data  # Base64 encoded payload
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at  # Wall-clock timestamp; 0 means never expires
+    
+    @property
+    def size(self) -> int:
+        return len(self.data)
+    
+    def is_fresh(self) -> bool:
+        return not self.expires_at or self.expires_at > time.time()
+    
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating a stale entry."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+    
+    def to_inline_data(self) -> ADKInlineData:
+        return ADKInlineData(mimeType=self.mime_type, data=self.data)
+    
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class AttachmentCache:
+    """
+    Byte-bounded LRU cache of processed attachments.
+    
+    Entries are keyed either by source URL (`url:<url>`) or by a hash of their
+    Base64 payload (`sha256:<hex>`). Entries evicted from memory can optionally
+    be spilled to a local directory, which is itself bounded in size.
+    """
+    
+    def __init__(self, max_bytes: int, default_ttl: float = 0,
+                 spill_dir: Optional[str] = None, spill_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.spill_dir = spill_dir or None
+        self.spill_max_bytes = spill_max_bytes
+        self._entries: "OrderedDict[str, CachedAttachment]" = OrderedDict()
+        self._size = 0
+        self._spilled: "OrderedDict[str, int]" = OrderedDict()  # Spill file path -> size
+        self._spilled_size = 0
+        self.hits = 0
+        self.misses = 0
+        
+        if self.spill_dir:
+            self._load_spill_index()
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+    
+    @staticmethod
+    def url_key(url: str) -> str:
+        return f"url:{url}"
+    
+    @staticmethod
+    def content_key(base64_data: str) -> str:
+        return f"sha256:{hashlib.sha256(base64_data.encode('ascii', 'replace')).hexdigest()}"
+    
+    async def get(self, key: str) -> Optional[CachedAttachment]:
+        """Look up an entry in memory, then in the spill directory."""
+        if not self.enabled:
+            return None
+        
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        
+        if self.spill_dir:
+            path = self._spill_path(key)
+            if path in self._spilled:
+                self._spilled_size -= self._spilled.pop(path)
+                loop = asyncio.get_running_loop()
+                entry = await loop.run_in_executor(None, self._read_spill, path)
+                if entry is not None:
+                    self.hits += 1
+                    await self._spill(self._store(key, entry))
+                    return entry
+        
+        self.misses += 1
+        return None
+    
+    async def put(self, key: str, entry: CachedAttachment):
+        """Insert an entry, evicting (and optionally spilling) least recently used ones."""
+        if not self.enabled or entry.size > self.max_bytes:
+            return
+        
+        await self._spill(self._store(key, entry))
+    
+    def discard(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+    
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "spilled_entries": len(self._spilled),
+            "spilled_bytes": self._spilled_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+    
+    def freshness_from_headers(self, headers: httpx.Headers) -> Optional[float]:
+        """
+        Compute the expiry timestamp for a response from its caching headers.
+        Returns None if the response must not be cached.
+        
+        Without Cache-Control or Expires the origin has not allowed reuse:
+        the response is only cached for `default_ttl` when that is set
+        (opt-in), otherwise it is kept stale when it has an ETag or
+        Last-Modified so it can be revalidated, and not cached at all without them.
+        """
+        cache_control = headers.get("cache-control", "").lower()
+        if "no-store" in cache_control or "private" in cache_control:
+            return None
+        if "no-cache" in cache_control:
+            # Cacheable, but must be revalidated before every reuse
+            return time.time() - 1
+        
+        match = re.search(r"max-age=(\d+)", cache_control)
+        if match:
+            return time.time() + int(match.group(1))
+        
+        expires = headers.get("expires")
+        if expires:
+            try:
+                return parsedate_to_datetime(expires).timestamp()
+            except (TypeError, ValueError):
+                return time.time() - 1
+        
+        if self.default_ttl > 0:
+            return time.time() + self.default_ttl
+        if "etag" in headers or "last-modified" in headers:
+            return time.time() - 1
+        return None
+    
+    def _store(self, key: str, entry: CachedAttachment) -> Dict[str, CachedAttachment]:
+        """Insert into memory and return the entries evicted to make room."""
+        self.discard(key)
+        self._entries[key] = entry
+        self._size += entry.size
+        
+        evicted = {}
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._size -= old_entry.size
+            evicted[old_key] = old_entry
+        return evicted
+    
+    async def _spill(self, evicted: Dict[str, CachedAttachment]):
+        """Move entries evicted from memory to the spill directory, if enabled."""
+        if not evicted or not self.spill_dir:
+            return
+        
+        loop = asyncio.get_running_loop()
+        written = await loop.run_in_executor(None, self._write_spill, evicted)
+        for path, size in written:
+            self._spilled_size -= self._spilled.pop(path, 0)
+            self._spilled[path] = size
+            self._spilled_size += size
+        
+        removed = []
+        while self._spilled and self._spilled_size > self.spill_max_bytes:
+            path, size = self._spilled.popitem(last=False)
+            self._spilled_size -= size
+            removed.append(path)
+        if removed:
+            await loop.run_in_executor(None, self._remove_files, removed)
+    
+    def _spill_path(self, key: str) -> str:
+        return os.path.join(self.spill_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+    
+    def _load_spill_index(self):
+        """Index spill files left by a previous run, oldest first."""
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            files = [entry for entry in os.scandir(self.spill_dir) if entry.name.endswith(".json")]
+        except OSError as e:
+            logger.error("Attachment cache spill directory unavailable, disabling spill: %s", e)
+            self.spill_dir = None
+            return
+        
+        for entry in sorted(files, key=lambda f: f.stat().st_mtime):
+            size = entry.stat().st_size
+            self._spilled[entry.path] = size
+            self._spilled_size += size
+    
+    def _write_spill(self, evicted: Dict[str, CachedAttachment]) -> List[Tuple[str, int]]:
+        """Write evicted entries to disk (runs in a worker thread)."""
+        written = []
+        for key, entry in evicted.items():
+            if not entry.is_fresh() and not entry.validators():
+                continue
+            path = self._spill_path(key)
+            try:
+                payload = json.dumps(dict(entry.to_dict(), key=key))
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(payload)
+            except OSError as e:
+                logger.warning("Failed to spill attachment to disk: %s", e)
+                continue
+            written.append((path, len(payload)))
+        return written
+    
+    def _read_spill(self, path: str) -> Optional[CachedAttachment]:
+        """Load a spilled entry and remove it from disk (runs in a worker thread)."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+            os.remove(path)
+        except (OSError, ValueError) as e:
+            logger.warning("Failed to read spilled attachment: %s", e)
+            return None
+        
+        payload.pop("key", None)
+        return CachedAttachment(**payload)
+    
+    @staticmethod
+    def _remove_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Create global attachment cache shared by all processors
+attachment_cache = AttachmentCache(
+    max_bytes=settings.attachment_cache_max_mb * 1024 * 1024,
+    default_ttl=settings.attachment_cache_ttl,
+    spill_dir=settings.attachment_cache_spill_dir,
+    spill_max_bytes=settings.attachment_cache_spill_max_mb * 1024 * 1024
+)
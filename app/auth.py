@@ -53,7 +53,7 @@ class APIKeyAuth:
         
         # Validate API key
         if api_key not in self.api_keys:
-            logger.warning(f"Invalid API key provided: {api_key[:10]}...")
+            logger.warning("Invalid API key provided: %s...", api_key[:10])
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail={
@@ -67,7 +67,7 @@ class APIKeyAuth:
                 headers={"WWW-Authenticate": "Bearer"},
             )
         
-        logger.debug(f"API key validated successfully: {api_key[:10]}...")
+        logger.debug("API key validated successfully: %s...", api_key[:10])
         return True
 
 
@@ -0,0 +1,139 @@
+import asyncio
+import bisect
+import hashlib
+import random
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+import httpx
+from app.resilience import CircuitBreaker
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONSISTENT_HASH = "consistent_hash"
+LEAST_OUTSTANDING = "least_outstanding"
+
+
+class Backend:
+    """One ADK replica with its load, health and circuit breaker state."""
+    
+    def __init__(self, url: str, failure_threshold: int, reset_timeout: float):
+        self.url = url.rstrip("/")
+        self.outstanding = 0  # Requests currently routed to this replica
+        self.healthy = True  # Result of the active health checks
+        self.health_failures = 0
+        # Passive ejection: consecutive call failures open the breaker
+        self.circuit_breaker = CircuitBreaker(self.url, failure_threshold, reset_timeout)
+    
+    @property
+    def available(self) -> bool:
+        return self.healthy and not self.circuit_breaker.rejecting
+    
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "outstanding": self.outstanding,
+            "healthy": self.healthy,
+            "circuit": self.circuit_breaker.state,
+            "available": self.available
+        }
+
+
+class BackendPool:
+    """
+    Routes ADK calls across replicas.
+    
+    `consistent_hash` maps each session to a fixed replica on a hash ring, so
+    a session keeps landing on the replica that holds it; when that replica
+    is ejected its sessions move to the next one on the ring.
+    `least_outstanding` picks the replica with the fewest requests in flight
+    and is only suitable when replicas share a session store.
+    
+    Replicas are ejected when their circuit breaker opens or when active
+    health checks fail, and re-admitted once they recover.
+    """
+    VIRTUAL_NODES = 100
+    
+    def __init__(self, urls: List[str], strategy: str = CONSISTENT_HASH,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 health_check_path: str = "/list-apps", unhealthy_threshold: int = 2):
+        if not urls:
+            raise ValueError("At least one ADK backend URL is required")
+        if strategy not in (CONSISTENT_HASH, LEAST_OUTSTANDING):
+            raise ValueError(f"Unknown ADK routing strategy: {strategy}")
+        
+        self.backends = [Backend(url, failure_threshold, reset_timeout) for url in urls]
+        self.strategy = strategy
+        self.health_check_path = health_check_path
+        self.unhealthy_threshold = unhealthy_threshold
+        self._ring: List[Tuple[int, int]] = sorted(
+            (self._hash(f"{backend.url}#{i}"), index)
+            for index, backend in enumerate(self.backends)
+            for i in range(self.VIRTUAL_NODES)
+        )
+        self._ring_hashes = [point for point, _ in self._ring]
+    
+    def select(self, session_key: str) -> Backend:
+        """Pick the replica for a request; falls back to an unavailable one if all are down."""
+        if len(self.backends) == 1:
+            return self.backends[0]
+        if self.strategy == LEAST_OUTSTANDING:
+            return self._least_outstanding()
+        return self._consistent_hash(session_key)
+    
+    @contextmanager
+    def track(self, backend: Backend) -> Iterator[Backend]:
+        """Count a request as outstanding on `backend` for the duration of the block."""
+        backend.outstanding += 1
+        try:
+            yield backend
+        finally:
+            backend.outstanding -= 1
+    
+    def stats(self) -> List[dict]:
+        return [backend.stats() for backend in self.backends]
+    
+    async def run_health_checks(self, client: httpx.AsyncClient, interval: float, timeout: float):
+        """Periodically probe every replica until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            await asyncio.gather(*(self._check(client, backend, timeout) for backend in self.backends))
+    
+    async def _check(self, client: httpx.AsyncClient, backend: Backend, timeout: float):
+        try:
+            response = await client.get(f"{backend.url}{self.health_check_path}", timeout=timeout)
+            ok = response.status_code < 500
+        except httpx.HTTPError:
+            ok = False
+        
+        if ok:
+            backend.health_failures = 0
+            if not backend.healthy:
+                logger.info("ADK backend %s passed health check, re-admitting", backend.url)
+                backend.healthy = True
+            return
+        
+        backend.health_failures += 1
+        if backend.healthy and backend.health_failures >= self.unhealthy_threshold:
+            logger.warning("ADK backend %s failed %s health checks, ejecting", backend.url, backend.health_failures)
+            backend.healthy = False
+    
+    def _least_outstanding(self) -> Backend:
+        candidates = [backend for backend in self.backends if backend.available] or self.backends
+        fewest = min(backend.outstanding for backend in candidates)
+        return random.choice([backend for backend in candidates if backend.outstanding == fewest])
+    
+    def _consistent_hash(self, session_key: str) -> Backend:
+        start = bisect.bisect(self._ring_hashes, self._hash(session_key))
+        first: Optional[Backend] = None
+        for offset in range(len(self._ring)):
+            backend = self.backends[self._ring[(start + offset) % len(self._ring)][1]]
+            if backend.available:
+                return backend
+            if first is None:
+                first = backend
+        return first
+    
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
@@ -6,21 +6,94 @@ from typing import Optional, List
 class Settings(BaseSettings):
     # ADK Backend Configuration
     adk_host: str = "http://localhost:8000"
+    adk_hosts_str: str = Field(default="", alias="ADK_HOSTS")  # 多个 ADK 副本地址（逗号分隔），设置后覆盖 ADK_HOST
+    adk_routing_strategy: str = "consistent_hash"  # 多副本路由: consistent_hash (按会话固定副本) 或 least_outstanding
+    adk_health_check_interval: float = 10.0  # 多副本时主动健康检查间隔（秒），0 表示禁用
+    adk_health_check_path: str = "/list-apps"  # 健康检查请求路径
     adk_app_name: str = "agent"
+    adk_stream_mode: str = "sse"  # 流式模式: sse (使用 /run_sse 实时转发) 或 run (等待 /run 完整结果)
+    adk_token_streaming: bool = False  # 是否请求 ADK 进行 token 级流式输出
+    stream_coalesce_max_bytes: int = 1024  # 合并流式增量，累计达到该字节数时立即发送一帧
+    stream_coalesce_max_delay: float = 0.02  # 增量最长合并等待时间（秒），0 表示不合并
+    stream_keepalive_interval: float = 15.0  # ADK 无输出（如长时间工具调用）时发送 SSE 保活注释的间隔（秒），0 表示禁用
+    
+    # ADK HTTP Connection Pool Configuration
+    adk_max_connections: int = 100  # 连接池最大连接数
+    adk_max_keepalive_connections: int = 20  # 保持活跃的空闲连接数
+    adk_keepalive_expiry: float = 30.0  # 空闲连接保持时间（秒）
+    adk_http2: bool = False  # 是否启用 HTTP/2（需要安装 h2）
+    adk_connect_timeout: float = 10.0  # 建立连接超时（秒）
+    adk_run_timeout: float = 120.0  # /run 请求超时（秒）
+    adk_session_timeout: float = 30.0  # 创建会话请求超时（秒）
+    
+    # ADK Admission Control Configuration
+    adk_max_in_flight_per_app: int = 50  # 每个 ADK 应用同时进行的 /run 调用上限，0 表示不限制
+    adk_max_queue_per_app: int = 200  # 超出上限时等待队列长度，队列满时返回 429
+    adk_queue_timeout: float = 30.0  # 请求在队列中的最长等待时间（秒），超时返回 503
+    adk_retry_after: int = 5  # 拒绝请求时 Retry-After 响应头的秒数
+    
+    # ADK Retry / Circuit Breaker Configuration
+    adk_retry_max_attempts: int = 3  # ADK 调用最大尝试次数（含首次），仅重试未到达 ADK 的失败和 503
+    adk_retry_base_delay: float = 0.2  # 重试退避基础时间（秒），按指数增长并加随机抖动
+    adk_retry_max_delay: float = 2.0  # 单次重试退避上限（秒）
+    adk_circuit_failure_threshold: int = 5  # 连续失败多少次后熔断，0 表示禁用熔断
+    adk_circuit_reset_timeout: float = 30.0  # 熔断后多久放行一次探测请求（秒）
+    
+    # ADK Session Configuration
+    session_scope: str = "conversation"  # 会话粒度: conversation (每个对话独立会话) 或 user (每个用户共用一个会话)
+    session_conversation_header: str = "X-Conversation-Id"  # 携带对话 ID 的请求头，无对话 ID 时使用 session_{user}
+    session_id_from_first_message: bool = False  # 无对话 ID 时按第一条用户消息区分对话（仅适用于每轮都发送完整历史的客户端）
+    session_serialize_runs: bool = True  # 同一会话的请求按到达顺序逐个执行，不同会话之间仍并行
+    session_queue_max_depth: int = 10  # 每个会话排队等待的请求上限，超出返回 429
+    session_queue_timeout: float = 300.0  # 等待同一会话上一轮完成的最长时间（秒），超时返回 503
+    session_cache_max_size: int = 10000  # 会话缓存最大条目数
+    session_cache_ttl: float = 3600.0  # 会话缓存过期时间（秒），0 表示不过期
     
     # Middleware Server Configuration
     port: int = 8080
     log_level: str = "INFO"
+    log_format: str = "text"  # 日志格式: text 或 json
+    log_async: bool = True  # 是否通过后台线程异步写日志，避免阻塞事件循环
+    log_sample_rate: float = 1.0  # INFO/DEBUG 日志按消息模板采样的比例，1 表示全部输出
+    log_max_field_length: int = 200  # 日志中请求体字段的最大长度，超出部分截断
     
     # File Processing Limits
     max_file_size_mb: int = 20
     download_timeout: int = 30
+    download_concurrency_per_request: int = 4  # 单个请求内并发下载附件数
+    download_concurrency_global: int = 16  # 进程内并发下载附件总数
+    
+    # Attachment Cache Configuration
+    attachment_cache_max_mb: int = 256  # 内存附件缓存上限（MB），0 表示禁用
+    attachment_cache_ttl: int = 0  # 无缓存头时 URL 附件的缓存时间（秒），0 表示不缓存（有 ETag/Last-Modified 时每次重新验证）
+    attachment_cache_spill_dir: str = ""  # 内存淘汰条目溢出到的本地目录，空表示禁用
+    attachment_cache_spill_max_mb: int = 1024  # 溢出目录容量上限（MB）
+    
+    # CPU Offload Configuration
+    cpu_offload_threshold_kb: int = 256  # 超过该大小的 Base64 处理分片执行，哈希/MIME 检测放入线程池执行
+    cpu_offload_max_workers: int = 4  # 线程池最大线程数
+    cpu_offload_process_threshold_mb: int = 0  # 超过该大小时使用进程池，0 表示禁用
+    cpu_offload_process_workers: int = 2  # 进程池最大进程数
+    
+    # Upload File Store Configuration
+    file_store_dir: str = "./data/uploads"  # 上传文件的本地存储目录
+    file_store_ttl: int = 86400  # 上传文件未被使用时的保留时间（秒），0 表示永久保留
+    file_store_gc_interval: int = 600  # 过期文件清理间隔（秒），0 表示禁用
     
     # API Key Configuration
     require_api_key: bool = False  # 是否需要 API Key 验证
     api_keys_str: str = Field(default="", alias="API_KEYS")  # 从环境变量读取的字符串
     default_api_key: str = "sk-adk-middleware-key"  # 默认 API Key
     
+    @property
+    def adk_hosts(self) -> List[str]:
+        """解析 ADK_HOSTS 字符串为列表，未设置时使用 ADK_HOST"""
+        if self.adk_hosts_str:
+            hosts = [host.strip() for host in self.adk_hosts_str.split(",") if host.strip()]
+            if hosts:
+                return hosts
+        return [self.adk_host]
+    
     @property
     def api_keys(self) -> List[str]:
         """解析 API_KEYS 字符串为列表"""
@@ -33,4 +106,4 @@ class Settings(BaseSettings):
         case_sensitive = False
 
 
-settings = Settings()
\ No newline at end of file
+settings = Settings()
@@ -0,0 +1,132 @@
+from typing import List, Tuple
+
+# Actions reported by StreamDeltaTracker.feed
+FIRST = "first"
+PARTIAL = "partial"
+MESSAGE = "message"
+EXTENSION = "extension"
+DUPLICATE = "duplicate"
+RESET = "reset"
+
+# Inserted between the texts of consecutive model turns
+TURN_SEPARATOR = "\n\n"
+# Minimum suffix/prefix overlap for a reset event to be treated as a continuation
+MIN_OVERLAP = 10
+
+
+def _prefix_function(pattern: str) -> List[int]:
+    """KMP failure function: pi[i] is the longest proper border of pattern[:i + 1]."""
+    pi = [0] * len(pattern)
+    k = 0
+    for i in range(1, len(pattern)):
+        char = pattern[i]
+        while k and pattern[k] != char:
+            k = pi[k - 1]
+        if pattern[k] == char:
+            k += 1
+        pi[i] = k
+    return pi
+
+
+def suffix_prefix_overlap(previous: str, current: str) -> int:
+    """
+    Length of the longest suffix of `previous` that is also a prefix of `current`.
+    
+    Runs the KMP automaton of `current` over the tail of `previous`, so the
+    cost is linear in the length of the strings.
+    """
+    if not previous or not current:
+        return 0
+    
+    pi = _prefix_function(current)
+    m = len(current)
+    j = 0
+    for char in previous[-m:]:
+        if j == m:
+            j = pi[j - 1]
+        while j and current[j] != char:
+            j = pi[j - 1]
+        if current[j] == char:
+            j += 1
+    return j
+
+
+class StreamDeltaTracker:
+    """
+    Per-stream state used to turn ADK events into OpenAI deltas.
+    
+    ADK sends one complete event per model turn (narration, the answer after
+    a tool call, ...); each is a message of its own and is forwarded whole,
+    separated from earlier output by TURN_SEPARATOR. With token streaming a
+    turn arrives as partial events, which are forwarded as increments and
+    collected in a list joined lazily, avoiding quadratic string
+    concatenation. The complete event that closes such a turn repeats the
+    partials, so only text beyond them is forwarded: normally one prefix
+    comparison, with the linear-time overlap search only when the aggregated
+    text does not extend what was sent.
+    
+    One instance is created for each streaming response and dropped with it,
+    so memory grows with active streams only.
+    """
+    __slots__ = ("_turn", "_pending", "_turn_length", "emitted_length", "seen_events")
+    
+    def __init__(self):
+        self._turn = ""  # Partial text of the current turn, excluding pending pieces
+        self._pending: List[str] = []  # Partial pieces received since the turn text was built
+        self._turn_length = 0  # Length of the partial text of the current turn
+        self.emitted_length = 0  # Length of the content forwarded so far
+        self.seen_events = set()  # Fingerprints of events already processed
+    
+    @property
+    def turn_content(self) -> str:
+        """Partial text forwarded for the current turn."""
+        if self._pending:
+            self._turn = self._turn + "".join(self._pending)
+            self._pending = []
+        return self._turn
+    
+    def feed(self, content: str, partial: bool = False) -> Tuple[str, str]:
+        """
+        Process the text of one event.
+        Returns: (action, delta); delta is empty when nothing should be sent.
+        """
+        if partial:
+            # Token-level streaming sends incremental text of the current turn
+            action, delta = (PARTIAL, content) if self._turn_length else self._start_message(content)
+            self._pending.append(content)
+            self._turn_length += len(content)
+            self.emitted_length += len(delta)
+            return action, delta
+        
+        if not self._turn_length:
+            # A complete turn on its own
+            action, delta = self._start_message(content)
+            self.emitted_length += len(delta)
+            return action, delta
+        
+        # Aggregated event closing a partial turn: forward only what the partials missed
+        previous = self.turn_content
+        self._end_turn()
+        if content == previous:
+            return DUPLICATE, ""
+        if content.startswith(previous):
+            delta = content[len(previous):]
+            action = EXTENSION
+        else:
+            # Different format: skip any part already sent at the end of the
+            # partial text, otherwise send the full content
+            overlap = suffix_prefix_overlap(previous, content)
+            delta = content[overlap:] if overlap >= MIN_OVERLAP else content
+            action = RESET
+        self.emitted_length += len(delta)
+        return action, delta
+    
+    def _start_message(self, content: str) -> Tuple[str, str]:
+        if not self.emitted_length:
+            return FIRST, content
+        return MESSAGE, TURN_SEPARATOR + content
+    
+    def _end_turn(self):
+        self._turn = ""
+        self._pending = []
+        self._turn_length = 0
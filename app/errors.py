@@ -0,0 +1,30 @@
+class ADKRunError(Exception):
+    """ADK reported an error while running the agent (an `error` event on /run_sse)."""
+
+
+class ADKUnavailableError(Exception):
+    """
+    ADK cannot take the request right now; the client should retry later.
+    
+    Carries the HTTP status to answer with and a Retry-After hint in seconds.
+    """
+    status_code = 503
+    
+    def __init__(self, message: str, retry_after: float = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ADKOverloadedError(ADKUnavailableError):
+    """An admission queue (per app or per session) is full."""
+    status_code = 429
+
+
+class ADKQueueTimeoutError(ADKUnavailableError):
+    """The request waited in an admission queue longer than allowed."""
+    status_code = 503
+
+
+class CircuitOpenError(ADKUnavailableError):
+    """ADK is considered down; the call was rejected without contacting it."""
+    status_code = 503
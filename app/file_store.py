@@ -0,0 +1,179 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+from typing import Optional
+from app.config import settings
+from app.models import ADKInlineData
+import logging
+
+logger = logging.getLogger(__name__)
+
+HANDLE_PREFIX = "adkfile://"
+_HANDLE_PATTERN = re.compile(r"^adkfile://([0-9a-f]{64})$")
+
+
+class FileStoreWriter:
+    """
+    Receives one upload: hashes the raw bytes and writes the Base64 text to a
+    temporary file that is renamed to its content address on commit.
+    """
+    __slots__ = ("_file", "_sha256", "path")
+    
+    def __init__(self, root_dir: str):
+        fd, self.path = tempfile.mkstemp(dir=root_dir, suffix=".tmp")
+        self._file = os.fdopen(fd, "w", encoding="ascii")
+        self._sha256 = hashlib.sha256()
+    
+    def hash(self, chunk: bytes):
+        self._sha256.update(chunk)
+    
+    def write(self, base64_text: str):
+        self._file.write(base64_text)
+    
+    def close(self) -> str:
+        """Close the temporary file and return the content hash."""
+        self._file.close()
+        return self._sha256.hexdigest()
+    
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class FileStore:
+    """
+    Local content-addressed store for uploaded files.
+    
+    Files are kept Base64-encoded as `<sha256>.b64` with a `<sha256>.json`
+    metadata sidecar and are addressed by `adkfile://<sha256>` handles.
+    Entries not used for `ttl` seconds are removed by the garbage collector.
+    """
+    
+    def __init__(self, root_dir: str, ttl: float):
+        self.root_dir = root_dir
+        self.ttl = ttl
+    
+    @staticmethod
+    def is_handle(value: str) -> bool:
+        return value.startswith(HANDLE_PREFIX)
+    
+    @staticmethod
+    def make_handle(digest: str) -> str:
+        return f"{HANDLE_PREFIX}{digest}"
+    
+    def create_writer(self) -> FileStoreWriter:
+        os.makedirs(self.root_dir, exist_ok=True)
+        return FileStoreWriter(self.root_dir)
+    
+    async def commit(self, writer: FileStoreWriter, mime_type: str, filename: str, size: int) -> str:
+        """Finish an upload and return its handle; identical content is stored once."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._commit, writer, mime_type, filename, size)
+    
+    async def resolve(self, handle: str) -> Optional[ADKInlineData]:
+        """Load the inline data for a handle, or None if it is unknown or expired."""
+        match = _HANDLE_PATTERN.match(handle)
+        if not match:
+            logger.warning("Invalid file handle: %s", handle[:100])
+            return None
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._load, match.group(1))
+    
+    async def run_gc(self, interval: float):
+        """Periodically remove expired entries until cancelled; an interval <= 0 disables it."""
+        if interval <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await loop.run_in_executor(None, self.collect_garbage)
+                if removed:
+                    logger.info("File store garbage collection removed %s files", removed)
+            except Exception as e:
+                logger.error("File store garbage collection failed: %s", e)
+    
+    def collect_garbage(self) -> int:
+        """
+        Remove entries whose metadata was not touched within the TTL, and
+        payloads older than the TTL that have no metadata (a crash between
+        storing the payload and writing its metadata).
+        """
+        if self.ttl <= 0 or not os.path.isdir(self.root_dir):
+            return 0
+        
+        cutoff = time.time() - self.ttl
+        removed = 0
+        for entry in os.scandir(self.root_dir):
+            try:
+                if entry.stat().st_mtime >= cutoff:
+                    continue
+                if entry.name.endswith(".json"):
+                    digest = entry.name[:-len(".json")]
+                    self._remove(digest)
+                    removed += 1
+                elif entry.name.endswith(".b64"):
+                    _, meta_path = self._paths(entry.name[:-len(".b64")])
+                    if not os.path.exists(meta_path):
+                        os.remove(entry.path)
+                        removed += 1
+                elif entry.name.endswith(".tmp"):
+                    # Leftover from an interrupted upload
+                    os.remove(entry.path)
+            except OSError:
+                continue
+        return removed
+    
+    def _paths(self, digest: str):
+        base = os.path.join(self.root_dir, digest)
+        return base + ".b64", base + ".json"
+    
+    def _commit(self, writer: FileStoreWriter, mime_type: str, filename: str, size: int) -> str:
+        digest = writer.close()
+        data_path, meta_path = self._paths(digest)
+        
+        # Identical content replaces the existing payload, which also refreshes
+        # its age, so the orphan check in collect_garbage cannot remove it
+        # before the metadata below is written
+        os.replace(writer.path, data_path)
+        
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump({"mime_type": mime_type, "filename": filename, "size": size}, f)
+        return self.make_handle(digest)
+    
+    def _load(self, digest: str) -> Optional[ADKInlineData]:
+        data_path, meta_path = self._paths(digest)
+        try:
+            if self.ttl > 0 and os.stat(meta_path).st_mtime < time.time() - self.ttl:
+                self._remove(digest)
+                return None
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(data_path, "r", encoding="ascii") as f:
+                data = f.read()
+            # Refresh the entry's lifetime on use
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        
+        return ADKInlineData(mimeType=meta["mime_type"], data=data)
+    
+    def _remove(self, digest: str):
+        for path in self._paths(digest):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# Create global file store
+file_store = FileStore(root_dir=settings.file_store_dir, ttl=settings.file_store_ttl)
@@ -0,0 +1,173 @@
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+from typing import Any, Dict, Optional
+from app.config import settings
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Rendered before the record was queued (see _QueueHandler)
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that leaves the layout to the formatter of the target handler.
+    
+    The stock `prepare` formats the whole record, traceback included, into
+    the message and drops the exception, so JsonFormatter could not write it
+    as a separate field. Here only the message is merged and the traceback
+    is kept as `exc_text`; `exc_info` is dropped as usual, so frames are not
+    kept alive while the record waits in the queue.
+    """
+    _exception_formatter = logging.Formatter()
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exception_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep one in every N records per message template below WARNING.
+    
+    Records are grouped by their unformatted message, so lazily formatted
+    calls (`logger.info("... %s", value)`) sample per call site.
+    """
+    MAX_TEMPLATES = 10000
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.interval = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counts: Dict[Any, int] = {}
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.interval == 0:
+            return False
+        if self.interval == 1:
+            return True
+        
+        if len(self._counts) >= self.MAX_TEMPLATES:
+            self._counts.clear()
+        key = (record.name, record.msg)
+        count = self._counts.get(key, 0)
+        self._counts[key] = count + 1
+        return count % self.interval == 0
+
+
+class _RedactedPayload:
+    """Defers redaction and stringification until a record is actually emitted."""
+    __slots__ = ("payload", "max_length")
+    
+    def __init__(self, payload: Any, max_length: int):
+        self.payload = payload
+        self.max_length = max_length
+    
+    def __str__(self) -> str:
+        return str(redact_payload(self.payload, self.max_length))
+
+
+def redact_payload(payload: Any, max_length: int = 200) -> Any:
+    """
+    Copy of a JSON-like payload that is safe to log: inline file data and
+    Base64 data URLs are replaced by their length, other long strings are truncated.
+    """
+    if isinstance(payload, dict):
+        redacted = {}
+        for key, value in payload.items():
+            if key == "data" and isinstance(value, str) and len(value) > max_length:
+                redacted[key] = f"<{len(value)} chars redacted>"
+            else:
+                redacted[key] = redact_payload(value, max_length)
+        return redacted
+    if isinstance(payload, (list, tuple)):
+        return [redact_payload(item, max_length) for item in payload]
+    if isinstance(payload, str):
+        if payload.startswith("data:") and ";base64," in payload[:100]:
+            prefix = payload.split(",", 1)[0]
+            return f"{prefix},<{len(payload) - len(prefix) - 1} chars redacted>"
+        if len(payload) > max_length:
+            return f"{payload[:max_length]}...(+{len(payload) - max_length} chars)"
+    return payload
+
+
+def redacted(payload: Any, max_length: Optional[int] = None) -> _RedactedPayload:
+    """Wrap a payload for lazy, redacted logging: `logger.debug("Body: %s", redacted(body))`."""
+    return _RedactedPayload(payload, max_length or settings.log_max_field_length)
+
+
+def setup_logging():
+    """
+    Configure the root logger from settings.
+    
+    With LOG_ASYNC enabled records are handed to a queue and written by a
+    background thread, so handler I/O never runs on the event loop.
+    """
+    global _listener
+    
+    formatter = JsonFormatter() if settings.log_format.lower() == "json" else logging.Formatter(LOG_FORMAT)
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+    
+    if settings.log_async:
+        log_queue: queue.Queue = queue.Queue(-1)
+        handler: logging.Handler = _QueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler = stream_handler
+    
+    if settings.log_sample_rate < 1:
+        handler.addFilter(SamplingFilter(settings.log_sample_rate))
+    
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(getattr(logging, settings.log_level.upper()))
+
+
+def shutdown_logging():
+    """Flush queued records, stop the background writer and log synchronously from then on."""
+    global _listener
+    if _listener is None:
+        return
+    
+    listener, _listener = _listener, None
+    listener.stop()
+    
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler):
+            root.removeHandler(handler)
+            for target in listener.handlers:
+                for log_filter in handler.filters:
+                    target.addFilter(log_filter)
+                root.addHandler(target)
@@ -1,12 +1,13 @@
+import asyncio
+import math
 import logging
-import base64
 from contextlib import asynccontextmanager
 import httpx
 from fastapi import FastAPI, HTTPException, Request, Depends, UploadFile, File
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPAuthorizationCredentials
-from typing import Dict, Any
+from typing import AsyncIterator, Awaitable, Dict, Any, TypeVar
 
 from app.config import settings
 from app.models import (
@@ -15,25 +16,94 @@ from app.models import (
 )
 from app.adk_client import ADKClient
 from app.auth import verify_api_key_dependency
+from app.errors import ADKRunError, ADKUnavailableError
+from app import metrics, offload
+from app.attachment_cache import attachment_cache
+from app.file_store import file_store
+from app.logging_config import setup_logging, shutdown_logging, redacted
 
 # Configure logging
-logging.basicConfig(
-    level=getattr(logging, settings.log_level.upper()),
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+setup_logging()
 logger = logging.getLogger(__name__)
 
+# Prometheus 文本格式
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+# 上传文件的读取块大小
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# 客户端在响应前断开连接时使用的状态码（沿用 nginx 的 499）
+CLIENT_CLOSED_REQUEST = 499
+
+T = TypeVar("T")
+
 # Initialize ADK client
 adk_client = ADKClient()
 
 
+def _register_state_metrics():
+    """Expose state kept by the components as gauges, read when /metrics is scraped."""
+    def session_cache_removals():
+        stats = adk_client.session_cache_stats()
+        return {("eviction",): stats["evictions"], ("expiration",): stats["expirations"]}
+    
+    metrics.SESSION_CACHE_ENTRIES.set_function(lambda: {(): adk_client.session_cache_stats()["size"]})
+    metrics.SESSION_CACHE_HIT_RATIO.set_function(lambda: {(): adk_client.session_cache_stats()["hit_ratio"]})
+    metrics.SESSION_CACHE_REMOVALS.set_function(session_cache_removals)
+    
+    def attachment_cache_tiers(memory: str, disk: str):
+        def collect():
+            stats = attachment_cache.stats()
+            return {("memory",): stats[memory], ("disk",): stats[disk]}
+        return collect
+    
+    def attachment_cache_lookups():
+        stats = attachment_cache.stats()
+        return {("hit",): stats["hits"], ("miss",): stats["misses"]}
+    
+    metrics.ATTACHMENT_CACHE_ENTRIES.set_function(attachment_cache_tiers("entries", "spilled_entries"))
+    metrics.ATTACHMENT_CACHE_BYTES.set_function(attachment_cache_tiers("bytes", "spilled_bytes"))
+    metrics.ATTACHMENT_CACHE_LOOKUPS.set_function(attachment_cache_lookups)
+    metrics.ATTACHMENT_CACHE_HIT_RATIO.set_function(lambda: {(): attachment_cache.stats()["hit_ratio"]})
+    
+    # Summed over apps / sessions; per-session series would be unbounded
+    def admission(field: str):
+        def collect():
+            return {
+                (controller.scope,): sum(state[field] for state in controller.stats().values())
+                for controller in (adk_client.admission, adk_client.session_queue)
+            }
+        return collect
+    
+    metrics.ADMISSION_IN_FLIGHT.set_function(admission("in_flight"))
+    metrics.ADMISSION_QUEUED.set_function(admission("queued"))
+    
+    metrics.BACKEND_OUTSTANDING.set_function(
+        lambda: {(backend["url"],): backend["outstanding"] for backend in adk_client.backends.stats()}
+    )
+    metrics.BACKEND_AVAILABLE.set_function(
+        lambda: {(backend["url"],): int(backend["available"]) for backend in adk_client.backends.stats()}
+    )
+
+
+_register_state_metrics()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logger.info("ADK Middleware starting up...")
-    yield
-    # Shutdown
-    logger.info("ADK Middleware shutting down...")
+    await adk_client.start()
+    gc_task = asyncio.create_task(file_store.run_gc(settings.file_store_gc_interval))
+    try:
+        yield
+    finally:
+        # Shutdown
+        logger.info("ADK Middleware shutting down...")
+        gc_task.cancel()
+        await adk_client.close()
+        offload.shutdown()
+        shutdown_logging()
 
 
 # Create FastAPI app
@@ -56,53 +126,108 @@ app.add_middleware(
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={"error": {"message": "Internal server error", "type": "internal_error"}}
     )
 
 
+class ClientDisconnected(Exception):
+    """The client closed the connection before the response was ready."""
+
+
+async def _wait_for_disconnect(http_request: Request):
+    """Return once the client has closed the connection."""
+    while True:
+        message = await http_request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _cancel_on_disconnect(http_request: Request, work: Awaitable[T]) -> T:
+    """
+    Await `work` while watching the client connection.
+    
+    If the client goes away first, `work` is cancelled: the in-flight httpx
+    request to ADK is aborted and its connection released, and pending
+    attachment downloads are cancelled with it. Raises ClientDisconnected.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.create_task(_wait_for_disconnect(http_request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            # Let the cancelled request clean up before answering
+            await asyncio.gather(task, return_exceptions=True)
+    
+    if task.cancelled():
+        metrics.CLIENT_DISCONNECTS.inc(stage="before_response")
+        raise ClientDisconnected()
+    return task.result()
+
+
+async def _prime_stream(stream: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Wait for the first chunk before starting the streaming response, so that
+    failures before any output (admission rejection, ADK errors) can still be
+    answered with a proper HTTP status instead of a broken event stream.
+    """
+    try:
+        first_chunk = await stream.__anext__()
+    except StopAsyncIteration:
+        first_chunk = None
+    
+    async def replay() -> AsyncIterator[str]:
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        except asyncio.CancelledError:
+            # StreamingResponse cancels the generator when the client disconnects
+            metrics.CLIENT_DISCONNECTS.inc(stage="streaming")
+            logger.info("Client disconnected during streaming, ADK request cancelled")
+            raise
+        finally:
+            await stream.aclose()
+    
+    return replay()
+
+
 @app.post("/v1/chat/completions")
 async def create_chat_completion(
     request: ChatCompletionRequest,
+    http_request: Request,
     api_key_valid: bool = Depends(verify_api_key_dependency)
 ):
     """Create a chat completion (streaming or non-streaming)."""
     try:
-        logger.info(f"=== CHAT COMPLETION REQUEST START ===")
-        logger.info(f"Model: {request.model}, User: {request.user}, Stream: {request.stream}")
-        
-        # Log the complete request for debugging
-        logger.info(f"Complete request: {request.model_dump()}")
-        
-        # Log detailed message information
-        logger.info(f"Request has {len(request.messages)} messages")
-        for i, msg in enumerate(request.messages):
-            logger.info(f"Message {i}: role={msg.role}, content_type={type(msg.content).__name__}")
-            if isinstance(msg.content, str):
-                logger.info(f"  Content (string): '{msg.content}'")
-            else:
-                logger.info(f"  Content (array): {len(msg.content)} parts")
-                for j, part in enumerate(msg.content):
-                    logger.info(f"    Part {j}: type={part.type}")
-                    if part.type == "text" and part.text:
-                        logger.info(f"      Text: '{part.text}'")
-                    elif part.type == "image_url" and part.image_url:
-                        logger.info(f"      Image URL: '{part.image_url.url}'")
-                    else:
-                        logger.warning(f"      Unknown part content: {part}")
+        logger.info(
+            "Chat completion request: model=%s, user=%s, stream=%s, messages=%d",
+            request.model, request.user, request.stream, len(request.messages)
+        )
         
-        logger.info(f"=== CHAT COMPLETION REQUEST END ===")
+        # Full request body only at DEBUG, with file data redacted
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Complete request: %s", redacted(request.model_dump()))
         
         # Validate request
         if not request.messages:
             raise HTTPException(status_code=400, detail="Messages cannot be empty")
         
+        conversation_id = http_request.headers.get(settings.session_conversation_header)
+        
         if request.stream:
             # Return streaming response
+            stream = await _cancel_on_disconnect(
+                http_request, _prime_stream(adk_client.create_chat_completion_stream(request, conversation_id))
+            )
             return StreamingResponse(
-                adk_client.create_chat_completion_stream(request),
+                stream,
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache",
@@ -112,22 +237,43 @@ async def create_chat_completion(
             )
         else:
             # Return non-streaming response
-            response = await adk_client.create_chat_completion(request)
-            logger.info(f"Successfully generated response for user: {request.user}")
+            response = await _cancel_on_disconnect(
+                http_request, adk_client.create_chat_completion(request, conversation_id)
+            )
+            logger.info("Successfully generated response for user: %s", request.user)
             return response
         
+    except HTTPException:
+        raise
+    except ClientDisconnected:
+        # Nobody is listening any more; the status only shows up in access logs
+        logger.info("Client disconnected before the response was ready, ADK request cancelled")
+        return Response(status_code=CLIENT_CLOSED_REQUEST)
+    except ADKUnavailableError as e:
+        # Load shedding: tell the client when to retry instead of letting it time out
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
     except ValueError as e:
-        logger.warning(f"Validation error: {e}")
+        logger.warning("Validation error: %s", e)
         raise HTTPException(status_code=400, detail=str(e))
     except httpx.HTTPStatusError as e:
         # Handle error without reading response content that might be closed
-        logger.error(f"ADK HTTP error: {e.response.status_code} - {e.response.reason_phrase}")
+        logger.error("ADK HTTP error: %s - %s", e.response.status_code, e.response.reason_phrase)
         if e.response.status_code >= 500:
             raise HTTPException(status_code=502, detail="ADK service unavailable")
         else:
             raise HTTPException(status_code=400, detail="Bad request to ADK service")
+    except httpx.TransportError as e:
+        logger.error("ADK connection error: %s: %s", type(e).__name__, e)
+        raise HTTPException(status_code=502, detail="ADK service unavailable")
+    except ADKRunError as e:
+        logger.error("%s", e)
+        raise HTTPException(status_code=502, detail="ADK run failed")
     except Exception as e:
-        logger.error(f"Error creating chat completion: {e}")
+        logger.error("Error creating chat completion: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -141,7 +287,7 @@ async def list_models(
         response = await adk_client.list_models()
         return response
     except Exception as e:
-        logger.error(f"Error listing models: {e}")
+        logger.error("Error listing models: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
@@ -151,54 +297,77 @@ async def health_check() -> HealthResponse:
     return HealthResponse()
 
 
+@app.get("/metrics")
+async def get_metrics() -> Response:
+    """Prometheus metrics endpoint."""
+    return Response(content=metrics.registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 @app.post("/upload")
 async def upload_file(
     file: UploadFile = File(...),
+    include_data: bool = False,
     api_key: HTTPAuthorizationCredentials = Depends(verify_api_key_dependency)
 ) -> Dict[str, Any]:
     """
-    上传文件并转换为Base64格式供ADK使用
+    上传文件供ADK使用
+    默认将文件保存到本地存储并返回 adkfile:// 句柄，可直接作为 image_url 的 url 使用；
+    include_data=true 时改为直接返回Base64数据
+    文件按块读取，读取过程中检查大小限制并增量编码，避免整个文件驻留内存
     """
     try:
         from app.multimodal import MultimodalProcessor
         processor = MultimodalProcessor()
         
-        # 读取文件内容
-        file_content = await file.read()
-        
-        # 验证和处理文件
-        is_valid, error_msg, detected_mime = processor.validate_file(
-            file_content, file.filename, file.content_type
-        )
-        
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=error_msg)
+        if include_data:
+            # 流式读取、验证并转换为Base64
+            inline_data, error_msg, file_size = await processor.process_file_stream(
+                _iter_upload_chunks(file), file.filename, file.content_type
+            )
+            
+            if not inline_data:
+                raise HTTPException(status_code=400, detail=error_msg or "文件处理失败")
+            
+            return {
+                "success": True,
+                "filename": file.filename,
+                "mime_type": inline_data.mimeType,
+                "base64_data": inline_data.data,
+                "size": file_size
+            }
         
-        # 转换为Base64
-        inline_data = processor.process_base64_file(
-            base64.b64encode(file_content).decode('utf-8'),
-            file.filename,
-            detected_mime
+        # 流式读取、验证并保存到本地文件存储
+        handle, mime_type, error_msg, file_size = await processor.store_file_stream(
+            _iter_upload_chunks(file), file.filename, file.content_type
         )
         
-        if not inline_data:
-            raise HTTPException(status_code=500, detail="文件处理失败")
+        if not handle:
+            raise HTTPException(status_code=400, detail=error_msg or "文件处理失败")
         
         return {
             "success": True,
             "filename": file.filename,
-            "mime_type": inline_data.mimeType,
-            "base64_data": inline_data.data,
-            "size": len(file_content)
+            "mime_type": mime_type,
+            "handle": handle,
+            "size": file_size
         }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"文件上传失败: {e}")
+        logger.error("文件上传失败: %s", e)
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
 
+async def _iter_upload_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    """按块读取上传文件"""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
 @app.get("/")
 async def root():
     """Root endpoint."""
@@ -0,0 +1,242 @@
+import bisect
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# 默认延迟分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# 附件大小分桶（字节）
+SIZE_BUCKETS = (1024, 10 * 1024, 100 * 1024, 512 * 1024, 1024 * 1024, 5 * 1024 * 1024,
+                10 * 1024 * 1024, 20 * 1024 * 1024, 50 * 1024 * 1024, 100 * 1024 * 1024)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing counter, optionally split by labels."""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+    
+    def inc(self, amount: float = 1, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+    
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+    
+    def observe(self, value: float, **labels: str):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+    
+    def time(self, **labels: str) -> "_Timer":
+        """Context manager observing the elapsed wall time of its block."""
+        return _Timer(self, labels)
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read from a callback at scrape time, for state that other
+    components already track (cache sizes, queue depths, counters kept by
+    the cache itself). The callback returns label values -> value.
+    """
+    
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 metric_type: str = "gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.metric_type = metric_type  # "counter" for cumulative values
+        self._collect: Optional[Callable[[], Dict[Tuple, float]]] = None
+    
+    def set_function(self, collect: Callable[[], Dict[Tuple, float]]):
+        self._collect = collect
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        if self._collect is None:
+            return lines
+        values = {tuple(str(v) for v in key): value for key, value in self._collect().items()}
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "start")
+    
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Holds all metrics of the process and renders them for scraping."""
+    
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: List = []
+    
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(self.prefix + name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+    
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Optional[Sequence[float]] = None) -> Histogram:
+        metric = Histogram(self.prefix + name, documentation, labelnames, buckets or LATENCY_BUCKETS)
+        self._metrics.append(metric)
+        return metric
+    
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              metric_type: str = "gauge") -> Gauge:
+        metric = Gauge(self.prefix + name, documentation, labelnames, metric_type)
+        self._metrics.append(metric)
+        return metric
+    
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Create global registry and the middleware's metrics
+registry = MetricsRegistry(prefix="adk_middleware_")
+
+REQUEST_LATENCY = registry.histogram(
+    "request_duration_seconds", "End-to-end chat completion latency.", ["stream"]
+)
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "time_to_first_token_seconds", "Time from request start to the first streamed content chunk."
+)
+ADK_RUN_LATENCY = registry.histogram(
+    "adk_run_duration_seconds", "Latency of ADK run calls (until response headers when streaming).", ["path"]
+)
+SESSION_CREATE_LATENCY = registry.histogram(
+    "adk_session_create_duration_seconds", "Latency of ADK session creation calls."
+)
+DOWNLOAD_LATENCY = registry.histogram(
+    "attachment_download_duration_seconds", "Attachment download and conversion time."
+)
+DOWNLOAD_BYTES = registry.histogram(
+    "attachment_download_bytes", "Size of downloaded attachments.", buckets=SIZE_BUCKETS
+)
+SESSION_CACHE_LOOKUPS = registry.counter(
+    "session_cache_lookups_total", "ADK session cache lookups by result.", ["result"]
+)
+SESSION_CACHE_ENTRIES = registry.gauge(
+    "session_cache_entries", "ADK sessions currently held in the session cache."
+)
+SESSION_CACHE_HIT_RATIO = registry.gauge(
+    "session_cache_hit_ratio", "Share of session cache lookups that were hits since start."
+)
+SESSION_CACHE_REMOVALS = registry.gauge(
+    "session_cache_removals_total", "Session cache entries dropped by reason (eviction or expiration).",
+    ["reason"], metric_type="counter"
+)
+ATTACHMENT_CACHE_ENTRIES = registry.gauge(
+    "attachment_cache_entries", "Attachments held in the cache by tier (memory or disk).", ["tier"]
+)
+ATTACHMENT_CACHE_BYTES = registry.gauge(
+    "attachment_cache_bytes", "Size of the cached attachments by tier (memory or disk).", ["tier"]
+)
+ATTACHMENT_CACHE_LOOKUPS = registry.gauge(
+    "attachment_cache_lookups_total", "Attachment cache lookups by result.", ["result"], metric_type="counter"
+)
+ATTACHMENT_CACHE_HIT_RATIO = registry.gauge(
+    "attachment_cache_hit_ratio", "Share of attachment cache lookups that were hits since start."
+)
+STREAM_DEDUP_SKIPS = registry.counter(
+    "stream_dedup_skips_total", "Streamed ADK events skipped by deduplication.", ["reason"]
+)
+ERRORS = registry.counter(
+    "errors_total", "Failed chat completions by ADK HTTP status (\"exception\" for non-HTTP errors).", ["status"]
+)
+ADMISSION_REJECTIONS = registry.counter(
+    "admission_rejections_total", "ADK calls rejected by admission control by scope (app or session) and reason.",
+    ["scope", "reason"]
+)
+ADMISSION_IN_FLIGHT = registry.gauge(
+    "admission_in_flight", "ADK calls holding an admission slot by scope (app or session).", ["scope"]
+)
+ADMISSION_QUEUED = registry.gauge(
+    "admission_queued", "ADK calls waiting for an admission slot by scope (app or session).", ["scope"]
+)
+ADK_RETRIES = registry.counter(
+    "adk_retries_total", "Retried ADK calls by operation.", ["operation"]
+)
+BACKEND_OUTSTANDING = registry.gauge(
+    "backend_outstanding_requests", "Requests currently routed to each ADK replica.", ["backend"]
+)
+BACKEND_AVAILABLE = registry.gauge(
+    "backend_available", "Whether each ADK replica takes traffic (1) or is ejected (0).", ["backend"]
+)
+CIRCUIT_TRANSITIONS = registry.counter(
+    "circuit_breaker_transitions_total", "ADK circuit breaker state changes.", ["circuit", "state"]
+)
+CLIENT_DISCONNECTS = registry.counter(
+    "client_disconnects_total", "Chat completions abandoned by the client, by stage.", ["stage"]
+)
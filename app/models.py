@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional, Union, Literal, Any
+from typing import Dict, List, Optional, Union, Literal, Any
 from enum import Enum
 
 
@@ -35,6 +35,7 @@ class ChatCompletionRequest(BaseModel):
     stream: bool = False
     user: Optional[str] = None
     temperature: Optional[float] = 1.0
+    metadata: Optional[Dict[str, Any]] = None
 
 
 class ChatCompletionResponseChoice(BaseModel):
@@ -43,12 +44,19 @@ class ChatCompletionResponseChoice(BaseModel):
     finish_reason: Optional[str] = None
 
 
+class Usage(BaseModel):
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    total_tokens: int = 0
+
+
 class ChatCompletionResponse(BaseModel):
     id: str
     object: str = "chat.completion"
     created: int
     model: str
     choices: List[ChatCompletionResponseChoice]
+    usage: Optional[Usage] = None
 
 
 class ChatCompletionStreamDelta(BaseModel):
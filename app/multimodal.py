@@ -1,20 +1,127 @@
 import re
+import asyncio
 import base64
 import mimetypes
+import time
 import magic
-from typing import List, Optional, Tuple, Union
+from typing import AsyncIterator, Callable, List, Optional, Tuple, Union
 import httpx
+from app.attachment_cache import CachedAttachment, attachment_cache
 from app.config import settings
+from app import metrics
+from app.file_store import FileStore, file_store
 from app.models import ContentPart, ADKPart, ADKInlineData
+from app.offload import SLICE_SIZE, map_slices, run_cpu_bound
 import logging
 
 logger = logging.getLogger(__name__)
 
+# libmagic 只需要文件头部即可识别类型（4 个 Base64 字符对应 3 个字节）
+MAGIC_HEADER_BYTES = 8192
+MAGIC_HEADER_CHARS = MAGIC_HEADER_BYTES // 3 * 4
+
+_BASE64_ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+_BASE64_PATTERN = re.compile(r'[A-Za-z0-9+/]*={0,2}')
+# 删除 b64decode 会忽略的 ASCII 字符（空白、换行等）
+_BASE64_IGNORED = str.maketrans("", "", "".join(
+    chr(code) for code in range(128) if chr(code) not in _BASE64_ALPHABET + "="
+))
+
+# 分片处理大负载时的切片长度，按 4 个字符对齐
+_BASE64_SLICE_CHARS = SLICE_SIZE // 4 * 4
+
+
+def _check_base64_slice(data: str) -> Tuple[bool, bool]:
+    """Whether a slice matches the Base64 pattern, and whether it ends with padding."""
+    return _BASE64_PATTERN.fullmatch(data) is not None, data.endswith("=")
+
+
+async def _is_canonical_base64(data: str) -> bool:
+    """Whether `data` is padded standard Base64 without whitespace, i.e. safe to pass through unchanged."""
+    if len(data) % 4 or not data.isascii():
+        return False
+    results = await map_slices(_check_base64_slice, data, _BASE64_SLICE_CHARS)
+    # Padding is only allowed at the very end
+    return all(matched for matched, _ in results) and not any(padded for _, padded in results[:-1])
+
+
+def _base64_decoded_size(data: str) -> int:
+    """Decoded byte length of canonical Base64 text."""
+    padding = 2 if data.endswith("==") else 1 if data.endswith("=") else 0
+    return len(data) // 4 * 3 - padding
+
+
+def _strip_base64(data: str) -> str:
+    return data.translate(_BASE64_IGNORED)
+
+
+async def _normalize_base64(data: str) -> str:
+    """
+    Canonical form of Base64 text, equal to re-encoding `base64.b64decode(data)`.
+    
+    Characters b64decode ignores are stripped in slices. Canonical text
+    re-encodes to itself except for unused bits in the padded last quad, so
+    only that quad is decoded and re-encoded; the payload itself is never
+    decoded. Text that is still not canonical (missing or misplaced padding)
+    is decoded and re-encoded in one call, so errors stay identical.
+    """
+    stripped = "".join(await map_slices(_strip_base64, data, _BASE64_SLICE_CHARS, allow_process=True))
+    if not await _is_canonical_base64(stripped):
+        return base64.b64encode(base64.b64decode(stripped)).decode('ascii')
+    
+    last_quad = stripped[-4:]
+    normalized_quad = base64.b64encode(base64.b64decode(last_quad)).decode('ascii')
+    return stripped if normalized_quad == last_quad else stripped[:-4] + normalized_quad
+
+
+# 进程级下载并发限制，所有请求共享
+_global_download_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_global_download_semaphore() -> asyncio.Semaphore:
+    global _global_download_semaphore
+    if _global_download_semaphore is None:
+        _global_download_semaphore = asyncio.Semaphore(max(1, settings.download_concurrency_global))
+    return _global_download_semaphore
+
+
+class Base64StreamEncoder:
+    """
+    Incrementally base64-encode a byte stream.
+    
+    Bytes are encoded in 3-byte aligned pieces as they arrive, so the raw
+    payload never has to be held in memory as a whole. Encoded pieces are
+    collected in memory, or handed to `sink` (e.g. a file writer) if given.
+    """
+    
+    def __init__(self, sink: Optional[Callable[[str], None]] = None):
+        self._pending = b""
+        self._parts: List[str] = []
+        self._sink = sink if sink is not None else self._parts.append
+        self.size = 0  # Raw bytes consumed so far
+    
+    def update(self, chunk: bytes):
+        self.size += len(chunk)
+        data = self._pending + chunk if self._pending else chunk
+        aligned = len(data) - len(data) % 3
+        if aligned:
+            self._sink(base64.b64encode(memoryview(data)[:aligned]).decode('ascii'))
+        self._pending = data[aligned:]
+    
+    def finalize(self) -> str:
+        """Flush the remaining bytes; returns the collected text (empty when using a sink)."""
+        if self._pending:
+            self._sink(base64.b64encode(self._pending).decode('ascii'))
+            self._pending = b""
+        return "".join(self._parts)
+
 
 class MultimodalProcessor:
     def __init__(self):
         self.max_file_size = settings.max_file_size_mb * 1024 * 1024  # Convert to bytes
         self.timeout = settings.download_timeout
+        self.attachment_cache = attachment_cache
+        self.file_store = file_store
         
         # 支持的文件类型配置
         self.supported_types = {
@@ -58,14 +165,17 @@ class MultimodalProcessor:
             "audio": 20 * 1024 * 1024       # 20MB
         }
         
-    def validate_file(self, file_data: bytes, filename: str, mime_type: str = None) -> Tuple[bool, str, str]:
+    def validate_file(self, file_data: bytes, filename: str, mime_type: str = None,
+                      file_size: Optional[int] = None) -> Tuple[bool, str, str]:
         """
         验证文件类型和大小
+        传入 file_size 时，file_data 只需包含文件头部（用于MIME类型检测）
         Returns: (is_valid, error_message, detected_mime_type)
         """
         try:
             # 检测文件大小
-            file_size = len(file_data)
+            if file_size is None:
+                file_size = len(file_data)
             
             # 检测MIME类型
             if not mime_type:
@@ -81,14 +191,7 @@ class MultimodalProcessor:
                 return False, f"不支持的文件类型: {mime_type}", mime_type
             
             # 确定文件类别和大小限制
-            category = None
-            size_limit = self.max_file_size  # 默认限制
-            
-            for cat, types in self.supported_types.items():
-                if mime_type in types:
-                    category = cat.rstrip('s')  # 移除复数形式
-                    size_limit = self.file_size_limits.get(category, self.max_file_size)
-                    break
+            size_limit = self.get_size_limit(mime_type)
             
             # 检查文件大小
             if file_size > size_limit:
@@ -98,12 +201,35 @@ class MultimodalProcessor:
             return True, "", mime_type
             
         except Exception as e:
-            logger.error(f"文件验证失败: {e}")
+            logger.error("文件验证失败: %s", e)
             return False, f"文件验证失败: {str(e)}", ""
 
-    def process_base64_file(self, base64_data: str, filename: str, mime_type: str = None) -> Optional[ADKInlineData]:
+    async def validate_file_async(self, file_data: bytes, filename: str, mime_type: str = None,
+                                  file_size: Optional[int] = None) -> Tuple[bool, str, str]:
+        """
+        validate_file 的异步版本，较大的数据在线程池中进行MIME类型检测
+        """
+        return await run_cpu_bound(
+            self.validate_file, file_data, filename, mime_type, file_size,
+            size=len(file_data), allow_process=False
+        )
+
+    def get_size_limit(self, mime_type: Optional[str]) -> int:
+        """
+        获取MIME类型对应类别的文件大小限制（字节），未知类型使用默认限制
+        """
+        if mime_type:
+            mime_type = mime_type.split(";")[0].strip().lower()
+            for cat, types in self.supported_types.items():
+                if mime_type in types:
+                    category = cat.rstrip('s')  # 移除复数形式
+                    return self.file_size_limits.get(category, self.max_file_size)
+        return self.max_file_size
+
+    async def process_base64_file(self, base64_data: str, filename: str, mime_type: str = None) -> Optional[ADKInlineData]:
         """
         处理Base64编码的文件数据
+        较大数据的校验和规范化分片执行，避免阻塞事件循环
         """
         try:
             # 解码Base64数据
@@ -111,96 +237,151 @@ class MultimodalProcessor:
                 # 移除数据URL前缀
                 base64_data = base64_data.split(",", 1)[1]
             
-            file_data = base64.b64decode(base64_data)
+            if not await _is_canonical_base64(base64_data):
+                # 去除空白等字符并规范化，无需完整解码
+                base64_data = await _normalize_base64(base64_data)
             
-            # 验证文件
-            is_valid, error_msg, detected_mime = self.validate_file(file_data, filename, mime_type)
+            # 根据编码长度计算大小，只解码头部用于类型检测，透传Base64数据
+            file_size = _base64_decoded_size(base64_data)
+            header = base64.b64decode(base64_data[:MAGIC_HEADER_CHARS])
+            is_valid, error_msg, detected_mime = self.validate_file(header, filename, mime_type, file_size=file_size)
             
             if not is_valid:
-                logger.error(f"文件验证失败: {error_msg}")
+                logger.error("文件验证失败: %s", error_msg)
                 return None
             
-            # 重新编码为Base64（确保格式正确）
-            final_base64 = base64.b64encode(file_data).decode('utf-8')
-            
             return ADKInlineData(
                 mimeType=detected_mime,
-                data=final_base64
+                data=base64_data
             )
             
         except Exception as e:
-            logger.error(f"处理Base64文件失败: {e}")
+            logger.error("处理Base64文件失败: %s", e)
             return None
 
+    async def process_file_stream(self, chunks: AsyncIterator[bytes], filename: str,
+                                  mime_type: str = None) -> Tuple[Optional[ADKInlineData], str, int]:
+        """
+        流式处理文件数据：根据首个数据块检测MIME类型，读取过程中检查类别大小限制，
+        并增量编码为Base64，无需在内存中保留完整的原始文件
+        Returns: (inline_data, error_message, file_size)
+        """
+        encoder = Base64StreamEncoder()
+        detected_mime, error_msg = await self._consume_file_stream(chunks, filename, mime_type, encoder.update)
+        if error_msg:
+            return None, error_msg, encoder.size
+        
+        base64_data = encoder.finalize()
+        return ADKInlineData(mimeType=detected_mime, data=base64_data), "", encoder.size
+
+    async def store_file_stream(self, chunks: AsyncIterator[bytes], filename: str,
+                                mime_type: str = None) -> Tuple[Optional[str], str, str, int]:
+        """
+        流式处理文件数据并保存到本地文件存储，Base64数据直接写入磁盘
+        Returns: (handle, detected_mime_type, error_message, file_size)
+        """
+        writer = self.file_store.create_writer()
+        encoder = Base64StreamEncoder(sink=writer.write)
+        
+        def consume(chunk: bytes):
+            writer.hash(chunk)
+            encoder.update(chunk)
+        
+        try:
+            detected_mime, error_msg = await self._consume_file_stream(chunks, filename, mime_type, consume)
+            if error_msg:
+                writer.abort()
+                return None, detected_mime, error_msg, encoder.size
+            
+            encoder.finalize()
+            handle = await self.file_store.commit(writer, detected_mime, filename, encoder.size)
+            return handle, detected_mime, "", encoder.size
+        except BaseException:
+            writer.abort()
+            raise
+
+    async def _consume_file_stream(self, chunks: AsyncIterator[bytes], filename: str, mime_type: Optional[str],
+                                   consume: Callable[[bytes], None]) -> Tuple[str, str]:
+        """
+        读取数据块并交给 consume 处理，首块检测类型，超过类别大小限制时立即停止
+        Returns: (detected_mime_type, error_message)
+        """
+        detected_mime = mime_type
+        size_limit = None
+        total_size = 0
+        
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            
+            if size_limit is None:
+                # 首个数据块：检测类型并确定大小限制
+                is_valid, error_msg, detected_mime = await self.validate_file_async(
+                    chunk[:MAGIC_HEADER_BYTES], filename, mime_type, file_size=0
+                )
+                if not is_valid:
+                    return detected_mime, error_msg
+                size_limit = self.get_size_limit(detected_mime)
+            
+            total_size += len(chunk)
+            if total_size > size_limit:
+                size_mb = size_limit / (1024 * 1024)
+                return detected_mime, f"文件大小超过限制 ({size_mb:.1f}MB)"
+            
+            # 数据块已有大小上限（上传为 1 MB），Base64 编码持有 GIL，放入线程池无助于事件循环，直接处理
+            consume(chunk)
+        
+        if size_limit is None:
+            return detected_mime, "文件内容为空"
+        return detected_mime, ""
+
     async def process_content(self, content_parts: List[ContentPart]) -> Tuple[str, List[ADKPart]]:
         """
         Process content parts, extracting text and handling multimodal content.
+        
+        Attachments are fetched concurrently (bounded per request and globally);
+        the resulting parts keep the original order and a failing attachment
+        does not affect the others.
         Returns tuple of (combined_text, adk_parts)
         """
         text_parts = []
-        adk_parts = []
+        attachment_jobs = []  # Coroutines resolving to Optional[ADKInlineData], in part order
+        request_semaphore = asyncio.Semaphore(max(1, settings.download_concurrency_per_request))
         
-        logger.info(f"Starting multimodal processing for {len(content_parts)} content parts")
+        logger.debug("Starting multimodal processing for %s content parts", len(content_parts))
         
         for i, part in enumerate(content_parts):
-            logger.info(f"Processing content part {i}: type={part.type}")
+            logger.debug("Processing content part %s: type=%s", i, part.type)
             
             if part.type == "text" and part.text:
-                logger.info(f"Found text part: {part.text[:100]}...")
+                logger.debug("Found text part: %s...", part.text[:100])
                 text_parts.append(part.text)
                 # Extract URLs from text for video/file processing
                 urls = self._extract_urls_from_text(part.text)
-                logger.info(f"Found {len(urls)} URLs in text: {urls}")
+                logger.debug("Found %s URLs in text: %s", len(urls), urls)
                 for url in urls:
-                    try:
-                        logger.info(f"Attempting to download URL: {url}")
-                        inline_data = await self._download_and_convert_url(url)
-                        if inline_data:
-                            logger.info(f"Successfully downloaded and converted URL: {inline_data.mimeType}")
-                            adk_parts.append(ADKPart(inlineData=inline_data))
-                        else:
-                            logger.warning(f"Failed to download URL: {url} - no data returned")
-                    except Exception as e:
-                        logger.error(f"Failed to process URL {url}: {e}")
+                    if FileStore.is_handle(url):
+                        attachment_jobs.append(self._resolve_handle(url))
+                    else:
+                        attachment_jobs.append(self._fetch_url(url, request_semaphore))
                         
             elif part.type == "image_url" and part.image_url:
-                logger.info(f"Found image_url part: {part.image_url.url[:100]}...")
+                logger.debug("Found image_url part: %s...", part.image_url.url[:100])
                 
                 # 检查是否为Base64数据
                 if part.image_url.url.startswith("data:"):
-                    try:
-                        logger.info(f"Processing Base64 image data")
-                        # 从数据URL中提取MIME类型和Base64数据
-                        mime_type = None
-                        if ":" in part.image_url.url:
-                            mime_type = part.image_url.url.split(":")[1].split(";")[0]
-                        
-                        inline_data = self.process_base64_file(
-                            part.image_url.url, 
-                            "image", 
-                            mime_type
-                        )
-                        if inline_data:
-                            logger.info(f"Successfully processed Base64 image: {inline_data.mimeType}")
-                            adk_parts.append(ADKPart(inlineData=inline_data))
-                        else:
-                            logger.warning(f"Failed to process Base64 image data")
-                    except Exception as e:
-                        logger.error(f"Failed to process Base64 image: {e}")
+                    attachment_jobs.append(self._process_data_url(part.image_url.url))
+                elif FileStore.is_handle(part.image_url.url):
+                    # 通过 /upload 上传的文件句柄
+                    attachment_jobs.append(self._resolve_handle(part.image_url.url))
                 else:
                     # 处理URL图片
-                    try:
-                        logger.info(f"Attempting to download image URL: {part.image_url.url}")
-                        inline_data = await self._download_and_convert_url(part.image_url.url)
-                        if inline_data:
-                            logger.info(f"Successfully downloaded and converted image: {inline_data.mimeType}, data length: {len(inline_data.data)}")
-                            adk_parts.append(ADKPart(inlineData=inline_data))
-                        else:
-                            logger.warning(f"Failed to download image URL: {part.image_url.url} - no data returned")
-                    except Exception as e:
-                        logger.error(f"Failed to process image URL {part.image_url.url}: {e}")
+                    attachment_jobs.append(self._fetch_url(part.image_url.url, request_semaphore))
             else:
-                logger.warning(f"Unsupported content part type: {part.type}")
+                logger.warning("Unsupported content part type: %s", part.type)
+        
+        results = await asyncio.gather(*attachment_jobs)
+        adk_parts = [ADKPart(inlineData=inline_data) for inline_data in results if inline_data]
         
         # Combine all text parts
         combined_text = " ".join(text_parts)
@@ -211,6 +392,64 @@ class MultimodalProcessor:
             
         return combined_text, adk_parts
     
+    async def _fetch_url(self, url: str, request_semaphore: asyncio.Semaphore) -> Optional[ADKInlineData]:
+        """Download one attachment under the per-request and global concurrency limits."""
+        try:
+            async with request_semaphore, _get_global_download_semaphore():
+                logger.debug("Attempting to download URL: %s", url)
+                inline_data = await self._download_and_convert_url(url)
+            if inline_data:
+                logger.debug("Successfully downloaded and converted URL: %s, data length: %s", inline_data.mimeType, len(inline_data.data))
+            else:
+                logger.warning("Failed to download URL: %s - no data returned", url)
+            return inline_data
+        except Exception as e:
+            logger.error("Failed to process URL %s: %s", url, e)
+            return None
+    
+    async def _resolve_handle(self, handle: str) -> Optional[ADKInlineData]:
+        """Resolve an `adkfile://` handle from the local file store."""
+        try:
+            inline_data = await self.file_store.resolve(handle)
+            if inline_data:
+                logger.debug("Resolved file handle %s: %s", handle, inline_data.mimeType)
+            else:
+                logger.warning("File handle not found or expired: %s", handle)
+            return inline_data
+        except Exception as e:
+            logger.error("Failed to resolve file handle %s: %s", handle, e)
+            return None
+    
+    async def _process_data_url(self, data_url: str) -> Optional[ADKInlineData]:
+        """Decode a Base64 data URL into inline data, reusing earlier results for identical payloads."""
+        try:
+            logger.debug("Processing Base64 image data")
+            # 从数据URL中提取MIME类型和Base64数据
+            mime_type = None
+            if ":" in data_url:
+                mime_type = data_url.split(":")[1].split(";")[0]
+            
+            cache_key = await run_cpu_bound(
+                self.attachment_cache.content_key, data_url, size=len(data_url), allow_process=False
+            )
+            cached = await self.attachment_cache.get(cache_key)
+            if cached:
+                logger.debug("Using cached Base64 image: %s", cached.mime_type)
+                return cached.to_inline_data()
+            
+            inline_data = await self.process_base64_file(data_url, "image", mime_type)
+            if inline_data:
+                logger.debug("Successfully processed Base64 image: %s", inline_data.mimeType)
+                await self.attachment_cache.put(
+                    cache_key, CachedAttachment(mime_type=inline_data.mimeType, data=inline_data.data)
+                )
+            else:
+                logger.warning("Failed to process Base64 image data")
+            return inline_data
+        except Exception as e:
+            logger.error("Failed to process Base64 image: %s", e)
+            return None
+    
     def _extract_urls_from_text(self, text: str) -> List[str]:
         """Extract HTTP/HTTPS URLs and file paths from text using regex."""
         urls = []
@@ -220,8 +459,13 @@ class MultimodalProcessor:
         http_urls = re.findall(http_pattern, text)
         urls.extend(http_urls)
         
+        # Extract adkfile:// handles returned by /upload
+        handle_pattern = r'adkfile://[0-9a-f]{64}'
+        handles = re.findall(handle_pattern, text)
+        urls.extend(handles)
+        
         # Extract file:// URLs
-        file_pattern = r'file://[^\s<>"{}|\\^`\[\]]+'
+        file_pattern = r'(?<![A-Za-z])file://[^\s<>"{}|\\^`\[\]]+'
         file_urls = re.findall(file_pattern, text)
         urls.extend(file_urls)
         
@@ -230,70 +474,96 @@ class MultimodalProcessor:
         windows_paths = re.findall(windows_pattern, text)
         urls.extend(windows_paths)
         
-        logger.info(f"Extracted URLs: {urls}")
+        logger.debug("Extracted URLs: %s", urls)
         return urls
     
     async def _download_and_convert_url(self, url: str) -> Optional[ADKInlineData]:
         """
         Download file from URL and convert to base64 inline data.
+        
+        The body is streamed and encoded incrementally; the download is aborted
+        as soon as it exceeds the size limit of its file category.
         Returns None if download fails or file is too large.
         """
-        logger.info(f"Starting download of URL: {url}")
+        cache_key = self.attachment_cache.url_key(url)
+        cached = await self.attachment_cache.get(cache_key)
+        if cached and cached.is_fresh():
+            logger.debug("Using cached attachment for URL: %s", url)
+            return cached.to_inline_data()
+        
+        logger.debug("Starting download of URL: %s", url)
+        started = time.perf_counter()
         try:
             async with httpx.AsyncClient(timeout=self.timeout) as client:
-                # First, get content type and file size with HEAD request
-                logger.info(f"Sending HEAD request to: {url}")
-                head_response = await client.head(url)
-                logger.info(f"HEAD response status: {head_response.status_code}")
-                
-                content_type = head_response.headers.get('content-type', '')
-                content_length = head_response.headers.get('content-length')
-                
-                logger.info(f"Content-Type: {content_type}, Content-Length: {content_length}")
-                
-                # Check file size
-                if content_length and int(content_length) > self.max_file_size:
-                    logger.warning(f"File too large: {content_length} bytes > {self.max_file_size} bytes")
-                    return None
-                
-                # Download the file
-                logger.info(f"Starting GET request to download file")
-                response = await client.get(url)
-                logger.info(f"GET response status: {response.status_code}")
-                response.raise_for_status()
-                
-                # Check actual file size
-                actual_size = len(response.content)
-                logger.info(f"Downloaded {actual_size} bytes")
-                
-                if actual_size > self.max_file_size:
-                    logger.warning(f"Downloaded file too large: {actual_size} bytes")
-                    return None
-                
-                # Determine MIME type
-                if not content_type:
-                    content_type, _ = mimetypes.guess_type(url)
+                headers = cached.validators() if cached else {}
+                async with client.stream("GET", url, headers=headers) as response:
+                    logger.debug("GET response status: %s", response.status_code)
+                    
+                    if response.status_code == 304 and cached:
+                        # Not modified, refresh the cached entry's lifetime
+                        expires_at = self.attachment_cache.freshness_from_headers(response.headers)
+                        if expires_at is None:
+                            self.attachment_cache.discard(cache_key)
+                        else:
+                            cached.expires_at = expires_at
+                        logger.debug("Cached attachment revalidated for URL: %s", url)
+                        return cached.to_inline_data()
+                    
+                    response.raise_for_status()
+                    
+                    content_type = response.headers.get('content-type', '')
+                    content_length = response.headers.get('content-length')
+                    logger.debug("Content-Type: %s, Content-Length: %s", content_type, content_length)
+                    
+                    # Determine MIME type
                     if not content_type:
-                        # Default to binary if we can't determine the type
-                        content_type = 'application/octet-stream'
-                
-                logger.info(f"Final MIME type: {content_type}")
-                
-                # Convert to base64
-                base64_data = base64.b64encode(response.content).decode('utf-8')
-                logger.info(f"Converted to base64, length: {len(base64_data)}")
-                
-                return ADKInlineData(
-                    mimeType=content_type,
-                    data=base64_data
-                )
+                        content_type, _ = mimetypes.guess_type(url)
+                        if not content_type:
+                            # Default to binary if we can't determine the type
+                            content_type = 'application/octet-stream'
+                    
+                    size_limit = self.get_size_limit(content_type)
+                    
+                    # Reject early when the declared size is already too large
+                    if content_length and content_length.isdigit() and int(content_length) > size_limit:
+                        logger.warning("File too large: %s bytes > %s bytes", content_length, size_limit)
+                        return None
+                    
+                    encoder = Base64StreamEncoder()
+                    async for chunk in response.aiter_bytes():
+                        encoder.update(chunk)
+                        if encoder.size > size_limit:
+                            logger.warning("Download exceeded size limit after %s bytes > %s bytes, aborting", encoder.size, size_limit)
+                            return None
+                    
+                    logger.debug("Downloaded %s bytes, final MIME type: %s", encoder.size, content_type)
+                    
+                    base64_data = encoder.finalize()
+                    logger.debug("Converted to base64, length: %s", len(base64_data))
+                    metrics.DOWNLOAD_LATENCY.observe(time.perf_counter() - started)
+                    metrics.DOWNLOAD_BYTES.observe(encoder.size)
+                    
+                    expires_at = self.attachment_cache.freshness_from_headers(response.headers)
+                    if expires_at is not None:
+                        await self.attachment_cache.put(cache_key, CachedAttachment(
+                            mime_type=content_type,
+                            data=base64_data,
+                            etag=response.headers.get('etag'),
+                            last_modified=response.headers.get('last-modified'),
+                            expires_at=expires_at
+                        ))
+                    
+                    return ADKInlineData(
+                        mimeType=content_type,
+                        data=base64_data
+                    )
                 
         except httpx.TimeoutException:
-            logger.error(f"Timeout downloading URL: {url}")
+            logger.error("Timeout downloading URL: %s", url)
             return None
         except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error downloading URL {url}: {e.response.status_code}")
+            logger.error("HTTP error downloading URL %s: %s", url, e.response.status_code)
             return None
         except Exception as e:
-            logger.error(f"Error downloading URL {url}: {e}")
-            return None
\ No newline at end of file
+            logger.error("Error downloading URL %s: %s", url, e)
+            return None
@@ -0,0 +1,101 @@
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence
+from app.config import settings
+
+# Slice length for calls that hold the GIL; one 1 MB slice of Base64 work takes a few milliseconds
+SLICE_SIZE = 1024 * 1024
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.cpu_offload_max_workers),
+            thread_name_prefix="cpu-offload"
+        )
+    return _thread_pool
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=max(1, settings.cpu_offload_process_workers))
+    return _process_pool
+
+
+def _select_executor(size: int, allow_process: bool) -> Optional[Executor]:
+    """Pick where a CPU-bound call on `size` bytes should run; None means inline."""
+    if size < settings.cpu_offload_threshold_kb * 1024:
+        return None
+    
+    process_threshold = settings.cpu_offload_process_threshold_mb * 1024 * 1024
+    if allow_process and process_threshold > 0 and size >= process_threshold:
+        return _get_process_pool()
+    return _get_thread_pool()
+
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any, size: int = 0, allow_process: bool = True) -> Any:
+    """
+    Run a CPU-bound call without blocking the event loop.
+    
+    Calls on payloads smaller than CPU_OFFLOAD_THRESHOLD_KB run inline, since the
+    executor hand-off would cost more than it saves. Larger ones go to a bounded
+    thread pool, or to a process pool above CPU_OFFLOAD_PROCESS_THRESHOLD_MB when
+    `allow_process` is set (func and args must then be picklable).
+    
+    The thread pool only keeps the loop responsive for calls that release the
+    GIL (hashlib, libmagic, file I/O); use `map_slices` for the others.
+    """
+    executor = _select_executor(size, allow_process)
+    if executor is None:
+        return func(*args)
+    
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args))
+
+
+async def map_slices(func: Callable[[Sequence], Any], data: Sequence, slice_size: int = SLICE_SIZE,
+                     allow_process: bool = False) -> List[Any]:
+    """
+    Apply `func` to consecutive slices of `data`, yielding to the event loop between slices.
+    
+    binascii (Base64) and re hold the GIL for the whole C call, so running them
+    in the thread pool still stalls the event loop for as long as the call
+    takes. Short slices run inline instead, letting other tasks run in
+    between. `slice_size` must make the slice results combine into the result
+    for the whole payload (e.g. 3-byte aligned for Base64 encoding).
+    
+    Payloads below CPU_OFFLOAD_THRESHOLD_KB are processed in one call; with
+    `allow_process`, payloads above CPU_OFFLOAD_PROCESS_THRESHOLD_MB go to the
+    process pool in one call.
+    """
+    executor = _select_executor(len(data), allow_process)
+    if executor is None:
+        return [func(data)]
+    if isinstance(executor, ProcessPoolExecutor):
+        loop = asyncio.get_running_loop()
+        return [await loop.run_in_executor(executor, func, data)]
+    
+    view = memoryview(data) if isinstance(data, (bytes, bytearray)) else data
+    results = []
+    for start in range(0, len(data), slice_size):
+        if start:
+            await asyncio.sleep(0)
+        results.append(func(view[start:start + slice_size]))
+    return results
+
+
+def shutdown():
+    """Shut down the offload executors."""
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
@@ -0,0 +1,127 @@
+import random
+import time
+from typing import Collection
+import httpx
+from app import metrics
+from app.errors import CircuitOpenError
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter for calls to ADK.
+    
+    Only failures that are safe to repeat are retried: errors raised before the
+    request reached ADK, and statuses (`retry_statuses`) that mean ADK did not
+    run it. 502/504 are not among them: a gateway may have passed the run on
+    to ADK, and repeating it would add the user turn to the session twice.
+    Idempotent calls such as session creation may also retry on any
+    transport error or 5xx.
+    """
+    
+    # Errors raised before the request was sent; repeating these cannot run an agent twice
+    PRE_SEND_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float,
+                 retry_statuses: Collection[int] = (503,)):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_statuses = frozenset(retry_statuses)
+    
+    def delay(self, attempt: int) -> float:
+        """Backoff before retry number `attempt` (0-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+    
+    def should_retry_error(self, error: Exception, attempt: int, idempotent: bool = False) -> bool:
+        if attempt + 1 >= self.max_attempts:
+            return False
+        if idempotent:
+            return isinstance(error, httpx.TransportError)
+        return isinstance(error, self.PRE_SEND_ERRORS)
+    
+    def should_retry_status(self, status_code: int, attempt: int, idempotent: bool = False) -> bool:
+        if attempt + 1 >= self.max_attempts:
+            return False
+        return status_code in self.retry_statuses or (idempotent and status_code >= 500)
+
+
+class CircuitBreaker:
+    """
+    Fast-fails ADK calls while the backend is down.
+    
+    After `failure_threshold` consecutive failed calls (retried attempts
+    count once, see ADKClient._send_with_retry) the circuit opens and calls
+    are rejected with CircuitOpenError. Once `reset_timeout` seconds have
+    passed a single probe call is let through (half-open): success closes the
+    circuit, failure re-opens it for another `reset_timeout`.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold  # 0 disables the breaker
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = 0.0
+    
+    @property
+    def rejecting(self) -> bool:
+        """Whether a call made now would be rejected by `before_call`."""
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return False
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            return now < self._opened_at + self.reset_timeout
+        return now - self._probe_started_at < self.reset_timeout
+    
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may be attempted now."""
+        if self.failure_threshold <= 0 or self.state == self.CLOSED:
+            return
+        
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            remaining = self._opened_at + self.reset_timeout - now
+            if remaining > 0:
+                raise CircuitOpenError(f"ADK circuit {self.name} is open", retry_after=remaining)
+            self._transition(self.HALF_OPEN)
+            self._probe_started_at = now
+            return
+        
+        # Half-open: one probe at a time; a probe that never reported back
+        # (e.g. cancelled) is replaced after reset_timeout
+        if now - self._probe_started_at < self.reset_timeout:
+            raise CircuitOpenError(
+                f"ADK circuit {self.name} is probing",
+                retry_after=self._probe_started_at + self.reset_timeout - now
+            )
+        self._probe_started_at = now
+    
+    def record_success(self):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+    
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        self.failures += 1
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self._opened_at = time.monotonic()
+            self._transition(self.OPEN)
+    
+    def _transition(self, state: str):
+        if state == self.OPEN:
+            logger.warning("ADK circuit %s opened after %s consecutive failures", self.name, self.failures)
+        else:
+            logger.info("ADK circuit %s is now %s", self.name, state)
+        self.state = state
+        metrics.CIRCUIT_TRANSITIONS.inc(circuit=self.name, state=state)
@@ -0,0 +1,190 @@
+import codecs
+import json
+import re
+import time
+from typing import Any, List, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the standard library
+    orjson = None
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+SSE_DONE = "data: [DONE]\n\n"
+# SSE 注释行，客户端会忽略，仅用于保持空闲连接
+SSE_KEEPALIVE = ": keep-alive\n\n"
+
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_str(obj: Any) -> str:
+    """Serialize to a compact JSON string."""
+    if orjson is not None:
+        return orjson.dumps(obj).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def loads(data: Union[bytes, str]) -> Any:
+    """Parse JSON from bytes or str; raises ValueError on malformed input."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class ChunkEncoder:
+    """
+    Builds OpenAI `chat.completion.chunk` SSE frames for one streaming response.
+    
+    The envelope (`id`, `object`, `created`, `model`) is serialized once per
+    stream; each frame only serializes its delta content.
+    """
+    __slots__ = ("completion_id", "_prefix")
+    
+    def __init__(self, model: str, completion_id: Optional[str] = None, created: Optional[int] = None):
+        created = created if created is not None else int(time.time())
+        self.completion_id = completion_id or f"chatcmpl-{created}"
+        envelope = dumps_str({
+            "id": self.completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model
+        })
+        self._prefix = f'data: {envelope[:-1]},"choices":[{{"index":0,"delta":'
+    
+    def delta(self, content: str) -> str:
+        """Frame carrying a content delta."""
+        return f'{self._prefix}{{"content":{dumps_str(content)}}},"finish_reason":null}}]}}\n\n'
+    
+    def finish(self, finish_reason: str = "stop") -> str:
+        """Final frame with an empty delta and the finish reason."""
+        return f'{self._prefix}{{}},"finish_reason":{dumps_str(finish_reason)}}}]}}\n\n'
+
+
+class JSONArrayParser:
+    """
+    Incremental parser for a top-level JSON array received in chunks.
+    
+    `feed` returns the elements completed so far, so only the unparsed tail
+    of the body is kept in memory. An element split across chunks is retried
+    only once the buffered text has doubled, which keeps the total parsing
+    work linear in the body size. A top-level value that is not an array is
+    buffered and returned whole by `close`.
+    """
+    _WHITESPACE = re.compile(r"[ \t\n\r]*")
+    _decoder = json.JSONDecoder()
+    # Characters that can follow a number prefix when the number continues
+    _NUMBER_CONTINUATION = frozenset(".eE+-")
+    
+    # Parser states
+    START = "start"  # Before the opening bracket
+    FIRST = "first"  # After "[", expecting an element or "]"
+    VALUE = "value"  # After ",", expecting an element
+    SEPARATOR = "separator"  # After an element, expecting "," or "]"
+    END = "end"  # After the closing bracket
+    OTHER = "other"  # Top-level value is not an array
+    
+    def __init__(self):
+        self.state = self.START
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._pieces: List[str] = []
+        self._size = 0
+        self._retry_at = 0  # Buffered length needed before parsing again
+    
+    @property
+    def is_array(self) -> bool:
+        return self.state not in (self.START, self.OTHER)
+    
+    def feed(self, data: bytes) -> List[Any]:
+        """Add a chunk of the body; returns the array elements completed by it."""
+        text = self._text_decoder.decode(data)
+        if text:
+            self._pieces.append(text)
+            self._size += len(text)
+        if self.state == self.OTHER or self._size < self._retry_at:
+            return []
+        return self._parse(final=False)
+    
+    def close(self) -> List[Any]:
+        """
+        Finish parsing at the end of the body.
+        Returns the remaining elements, or the whole value if it is not an
+        array; raises ValueError on malformed or truncated input.
+        """
+        text = self._text_decoder.decode(b"", final=True)
+        if text:
+            self._pieces.append(text)
+        if self.state in (self.START, self.OTHER):
+            # Not an array (or an empty body): fall back to a regular parse
+            self.state = self.OTHER
+            return [loads("".join(self._pieces))]
+        
+        elements = self._parse(final=True)
+        if self.state != self.END:
+            raise ValueError("Truncated JSON array")
+        return elements
+    
+    def _parse(self, final: bool) -> List[Any]:
+        buffer = "".join(self._pieces)
+        elements = []
+        pos = 0
+        incomplete = False
+        
+        while True:
+            pos = self._WHITESPACE.match(buffer, pos).end()
+            if pos >= len(buffer):
+                break
+            char = buffer[pos]
+            
+            if self.state == self.START:
+                if char != "[":
+                    self.state = self.OTHER
+                    break
+                self.state = self.FIRST
+                pos += 1
+            elif self.state == self.FIRST and char == "]":
+                self.state = self.END
+                pos += 1
+            elif self.state == self.SEPARATOR:
+                if char == ",":
+                    self.state = self.VALUE
+                elif char == "]":
+                    self.state = self.END
+                else:
+                    raise ValueError(f"Unexpected {char!r} in JSON array at offset {pos}")
+                pos += 1
+            elif self.state in (self.FIRST, self.VALUE):
+                try:
+                    value, end = self._decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if final:
+                        raise
+                    incomplete = True
+                    break
+                if (not final and isinstance(value, (int, float))
+                        and (end == len(buffer) or buffer[end] in self._NUMBER_CONTINUATION)):
+                    # A number cut at the end of the buffer ("1", "1.", "1.5e") may
+                    # continue in the next chunk; raw_decode accepts the shorter prefix
+                    incomplete = True
+                    break
+                elements.append(value)
+                self.state = self.SEPARATOR
+                pos = end
+            else:
+                raise ValueError(f"Unexpected data after JSON array at offset {pos}")
+        
+        if self.state == self.OTHER:
+            # Keep everything for the regular parse in close()
+            self._pieces = [buffer]
+            self._size = len(buffer)
+            return elements
+        
+        rest = buffer[pos:]
+        self._pieces = [rest] if rest else []
+        self._size = len(rest)
+        self._retry_at = 2 * self._size if incomplete else 0
+        return elements
@@ -0,0 +1,100 @@
+import asyncio
+from typing import AsyncGenerator, AsyncIterator, List, Optional
+
+# Marks the end of the source stream in the queue
+_END = object()
+# Deltas read ahead of the consumer; a slow client stops the reader at this depth
+QUEUE_SIZE = 64
+
+
+class _Failure:
+    """Exception raised by the source stream, handed over to the consumer."""
+    __slots__ = ("error",)
+    
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+async def coalesce(source: AsyncGenerator[str, None], max_bytes: int, max_delay: float,
+                   keepalive_interval: float = 0,
+                   keepalive_after: Optional[asyncio.Event] = None) -> AsyncIterator[Optional[str]]:
+    """
+    Batch the text deltas of `source` into fewer, larger ones.
+    
+    The first delta is passed through at once so time to first token is
+    unchanged. Later deltas are buffered until `max_bytes` (UTF-8) are pending
+    or the oldest pending delta has waited `max_delay` seconds; `max_delay`
+    of 0 disables coalescing. When nothing is pending and `source` stays
+    silent for `keepalive_interval` seconds (e.g. during a long tool call),
+    None is yielded so the caller can send a keep-alive; 0 disables them.
+    If `keepalive_after` is given, keep-alives wait until it is set, so
+    nothing is sent (and no status committed) before the run has started.
+    
+    `source` is read by a separate task, so a flush deadline never interrupts
+    a read in progress on the ADK response. At most QUEUE_SIZE deltas are
+    read ahead, so a slow client slows down reading from ADK.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+    
+    async def produce():
+        try:
+            async for piece in source:
+                await queue.put(piece)
+        except Exception as e:
+            await queue.put(_Failure(e))
+        else:
+            await queue.put(_END)
+        finally:
+            # When cancelled while waiting in queue.put, `source` is suspended at
+            # a yield; close it now so its slots and ADK response are released
+            # without waiting for garbage collection
+            await source.aclose()
+    
+    loop = asyncio.get_running_loop()
+    producer = asyncio.create_task(produce())
+    pending: List[str] = []
+    pending_bytes = 0
+    deadline = 0.0
+    first = True
+    
+    try:
+        while True:
+            if pending:
+                timeout = max(0.0, deadline - loop.time())
+            else:
+                timeout = keepalive_interval if keepalive_interval > 0 else None
+            
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                if pending:
+                    yield "".join(pending)
+                    pending, pending_bytes = [], 0
+                elif keepalive_after is None or keepalive_after.is_set():
+                    yield None
+                continue
+            
+            if item is _END or isinstance(item, _Failure):
+                if pending:
+                    yield "".join(pending)
+                if item is _END:
+                    return
+                raise item.error
+            
+            if first:
+                first = False
+                yield item
+                continue
+            
+            if not pending:
+                deadline = loop.time() + max_delay
+            pending.append(item)
+            pending_bytes += len(item.encode("utf-8"))
+            if pending_bytes >= max_bytes or max_delay <= 0:
+                yield "".join(pending)
+                pending, pending_bytes = [], 0
+    finally:
+        if not producer.done():
+            # Consumer went away (e.g. client disconnect): stop reading from ADK
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
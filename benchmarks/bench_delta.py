@@ -0,0 +1,83 @@
+"""
+Microbenchmark for streaming delta extraction on long answers.
+
+Feeds a 100 KB answer through StreamDeltaTracker as complete per-turn
+messages, as token-level partial events closed by the aggregated answer, and
+as a rewritten answer that forces the overlap search, and compares the
+overlap search with the previous quadratic slice-comparison loop.
+
+    python -m benchmarks.bench_delta --size-kb 100 --events 1000
+"""
+
+import argparse
+import time
+
+from app.delta import StreamDeltaTracker, suffix_prefix_overlap
+
+
+def legacy_overlap(previous: str, current: str) -> int:
+    """The former slice-by-slice suffix/prefix search, kept for comparison."""
+    overlap = 0
+    for i in range(1, min(len(previous), len(current)) + 1):
+        if previous[-i:] == current[:i]:
+            overlap = i
+    return overlap
+
+
+def make_text(size: int) -> str:
+    words = ["report", "analysis", "revenue", "quarter", "growth", "market", "agent", "summary"]
+    text, i = [], 0
+    while sum(len(w) + 1 for w in text) < size:
+        text.append(words[i % len(words)] + str(i % 97))
+        i += 1
+    return " ".join(text)[:size]
+
+
+def timed(label: str, func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<40} {elapsed * 1000:10.2f} ms")
+    return elapsed
+
+
+def run_messages(text: str, events: int):
+    tracker = StreamDeltaTracker()
+    step = max(1, len(text) // events)
+    for start in range(0, len(text), step):
+        tracker.feed(text[start:start + step])
+
+
+def run_partial(text: str, events: int):
+    tracker = StreamDeltaTracker()
+    step = max(1, len(text) // events)
+    for start in range(0, len(text), step):
+        tracker.feed(text[start:start + step], partial=True)
+    # ADK closes a partial stream with the aggregated answer
+    tracker.feed(text)
+
+
+def run_overlap(search, text: str, repeat: int):
+    # The new snapshot restarts half-way through the previous one
+    previous, current = text, text[len(text) // 2:] + "appended tail"
+    for _ in range(repeat):
+        search(previous, current)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark streaming delta extraction")
+    parser.add_argument("--size-kb", type=int, default=100, help="Length of the simulated answer")
+    parser.add_argument("--events", type=int, default=1000, help="Number of events the answer arrives in")
+    parser.add_argument("--repeat", type=int, default=3, help="Overlap searches per variant")
+    args = parser.parse_args()
+    
+    text = make_text(args.size_kb * 1024)
+    print(f"answer: {len(text)} chars, {args.events} events")
+    timed("complete messages", run_messages, text, args.events)
+    timed("partial (token streaming) events", run_partial, text, args.events)
+    timed(f"overlap search x{args.repeat} (KMP)", run_overlap, suffix_prefix_overlap, text, args.repeat)
+    timed(f"overlap search x{args.repeat} (legacy)", run_overlap, legacy_overlap, text, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
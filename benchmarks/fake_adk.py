@@ -0,0 +1,142 @@
+"""
+Local stand-in for an ADK API server, used by the benchmark harness.
+
+Implements the endpoints the middleware calls (session creation, /run and
+/run_sse) with configurable latency, response size, SSE cadence and session
+conflict behaviour, plus a static file endpoint for attachment downloads.
+
+    python -m benchmarks.fake_adk --port 8001 --latency-ms 50 --response-chars 2000
+"""
+
+import argparse
+import asyncio
+import json
+import struct
+import zlib
+from typing import AsyncIterator, List
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+
+def make_png(size_kb: int) -> bytes:
+    """A valid 1x1 PNG padded with an ancillary chunk to roughly `size_kb` KB."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    
+    header = chunk(b"IHDR", struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0))
+    padding = chunk(b"tEXt", b"pad\x00" + b"x" * max(0, size_kb * 1024 - 64))
+    pixels = chunk(b"IDAT", zlib.compress(b"\x00\x00"))
+    return b"\x89PNG\r\n\x1a\n" + header + padding + pixels + chunk(b"IEND", b"")
+
+
+def split_text(text: str, parts: int) -> List[str]:
+    step = max(1, -(-len(text) // max(1, parts)))
+    return [text[i:i + step] for i in range(0, len(text), step)]
+
+
+def adk_event(text: str, partial: bool = False) -> dict:
+    event = {
+        "author": "agent",
+        "content": {"role": "model", "parts": [{"text": text}]}
+    }
+    if partial:
+        event["partial"] = True
+    return event
+
+
+def tool_events(count: int, payload_kb: int) -> List[dict]:
+    """Function call / response pairs that precede the answer of a tool-heavy run."""
+    payload = "r" * (payload_kb * 1024)
+    events = []
+    for i in range(count):
+        call = {"name": "search", "args": {"query": f"query {i}"}}
+        events.append({"author": "agent", "content": {"role": "model", "parts": [{"functionCall": call}]}})
+        response = {"name": "search", "response": {"result": payload}}
+        events.append({"author": "agent", "content": {"role": "user", "parts": [{"functionResponse": response}]}})
+    return events
+
+
+def create_app(args: argparse.Namespace) -> FastAPI:
+    app = FastAPI(title="Fake ADK")
+    sessions = set()
+    response_text = ("lorem ipsum dolor sit amet " * (args.response_chars // 27 + 1))[:args.response_chars]
+    image = make_png(args.image_kb)
+    latency = args.latency_ms / 1000
+    interval = args.sse_interval_ms / 1000
+    tools = tool_events(args.tool_events, args.tool_payload_kb)
+    
+    @app.get("/health")
+    async def health():
+        return {"status": "ok"}
+    
+    @app.get("/list-apps")
+    async def list_apps():
+        return ["agent"]
+    
+    @app.post("/apps/{app_name}/users/{user_id}/sessions")
+    async def create_session(app_name: str, user_id: str, request: Request):
+        body = await request.json()
+        key = (app_name, user_id, body.get("sessionId"))
+        await asyncio.sleep(args.session_latency_ms / 1000)
+        if args.session_conflict or key in sessions:
+            return JSONResponse(status_code=409, content={"detail": "Session already exists"})
+        sessions.add(key)
+        return {"id": body.get("sessionId"), "appName": app_name, "userId": user_id}
+    
+    @app.post("/run")
+    async def run(request: Request):
+        await request.body()
+        await asyncio.sleep(latency)
+        pieces = split_text(response_text, args.sse_events)
+        # Intermediate events carry cumulative text, the last one the full answer
+        events = tools + [adk_event("".join(pieces[:i + 1])) for i in range(len(pieces))]
+        events[-1]["usageMetadata"] = {"promptTokenCount": 100, "candidatesTokenCount": 50, "totalTokenCount": 150}
+        return Response(content=json.dumps(events), media_type="application/json")
+    
+    @app.post("/run_sse")
+    async def run_sse(request: Request):
+        body = json.loads(await request.body())
+        token_streaming = bool(body.get("streaming"))
+        
+        async def events() -> AsyncIterator[str]:
+            await asyncio.sleep(latency)
+            if token_streaming:
+                for i, piece in enumerate(split_text(response_text, args.sse_events)):
+                    if i:
+                        await asyncio.sleep(interval)
+                    yield f"data: {json.dumps(adk_event(piece, partial=True))}\n\n"
+            # ADK sends one complete event per turn; it closes a partial stream with the aggregated text
+            yield f"data: {json.dumps(adk_event(response_text))}\n\n"
+        
+        return StreamingResponse(events(), media_type="text/event-stream")
+    
+    @app.get("/files/image.png")
+    async def image_file():
+        return Response(content=image, media_type="image/png", headers={"Cache-Control": "max-age=60"})
+    
+    return app
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Fake ADK server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency-ms", type=float, default=50, help="Delay before the first byte of a run")
+    parser.add_argument("--session-latency-ms", type=float, default=5, help="Delay of session creation")
+    parser.add_argument("--response-chars", type=int, default=2000, help="Length of the agent's answer")
+    parser.add_argument("--sse-events", type=int, default=20, help="Number of events the answer is split into (/run, token streaming)")
+    parser.add_argument("--sse-interval-ms", type=float, default=20, help="Delay between SSE events")
+    parser.add_argument("--session-conflict", action="store_true",
+                        help="Answer every session creation with 409, like a persistent ADK session store")
+    parser.add_argument("--image-kb", type=int, default=256, help="Size of /files/image.png")
+    parser.add_argument("--tool-events", type=int, default=0,
+                        help="Function call/response pairs before the answer of a /run")
+    parser.add_argument("--tool-payload-kb", type=int, default=16, help="Size of each function response")
+    return parser
+
+
+if __name__ == "__main__":
+    arguments = build_parser().parse_args()
+    uvicorn.run(create_app(arguments), host=arguments.host, port=arguments.port, log_level="warning")
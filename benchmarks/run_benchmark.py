@@ -0,0 +1,265 @@
+"""
+Benchmark driver for the ADK middleware.
+
+Starts the fake ADK server and the middleware as subprocesses, drives
+`/v1/chat/completions` with concurrent requests for each scenario and reports
+throughput, p50/p99 latency, time to first token, SSE content frames per
+streamed response and the middleware's RSS.
+Runs fully offline.
+
+    python -m benchmarks.run_benchmark --requests 500 --concurrency 50
+    python -m benchmarks.run_benchmark --scenarios text-stream --latency-ms 200 --sse-events 100
+
+Options not listed in `--help` (e.g. `--latency-ms`, `--session-conflict`) are
+passed through to `benchmarks.fake_adk`.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.fake_adk import make_png
+
+SCENARIOS = {
+    # name: (stream, attachment)
+    "text": (False, None),
+    "text-stream": (True, None),
+    "multimodal": (False, "inline"),
+    "multimodal-stream": (True, "inline"),
+    "multimodal-url": (False, "url"),
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def read_rss_mb(pid: int) -> Dict[str, Optional[float]]:
+    """Current and peak resident set size of a process (Linux only)."""
+    rss = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    rss["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return rss
+
+
+def build_payload(model: str, user: str, stream: bool, attachment: Optional[str],
+                  image_data_url: str, image_url: str) -> dict:
+    content = "Summarize the attached file in one paragraph."
+    if attachment:
+        url = image_data_url if attachment == "inline" else image_url
+        content = [
+            {"type": "text", "text": content},
+            {"type": "image_url", "image_url": {"url": url}}
+        ]
+    return {
+        "model": model,
+        "user": user,
+        "stream": stream,
+        "messages": [{"role": "user", "content": content}]
+    }
+
+
+async def run_request(client: httpx.AsyncClient, url: str, payload: dict, headers: dict) -> Dict:
+    started = time.perf_counter()
+    ttft = None
+    frames = None
+    if payload["stream"]:
+        frames = 0
+        async with client.stream("POST", url, json=payload, headers=headers) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return {"ok": False, "status": response.status_code}
+            async for line in response.aiter_lines():
+                if line.startswith("data:") and '"content"' in line:
+                    frames += 1
+                    if ttft is None:
+                        ttft = time.perf_counter() - started
+    else:
+        response = await client.post(url, json=payload, headers=headers)
+        if response.status_code != 200:
+            return {"ok": False, "status": response.status_code}
+        response.json()
+    return {"ok": True, "latency": time.perf_counter() - started, "ttft": ttft, "frames": frames}
+
+
+async def run_scenario(name: str, args: argparse.Namespace, image_data_url: str, image_url: str) -> Dict:
+    stream, attachment = SCENARIOS[name]
+    url = f"{args.middleware_url}/v1/chat/completions"
+    headers = {"Authorization": f"Bearer {args.api_key}"} if args.api_key else {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+        async def one(i: int) -> Dict:
+            payload = build_payload(args.model, f"bench-user-{i % args.users}", stream, attachment,
+                                    image_data_url, image_url)
+            async with semaphore:
+                try:
+                    return await run_request(client, url, payload, headers)
+                except httpx.HTTPError as e:
+                    return {"ok": False, "status": type(e).__name__}
+        
+        # Warm up connections, sessions and caches outside the measurement
+        await asyncio.gather(*(one(i) for i in range(min(args.warmup, args.requests))))
+        
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+    
+    latencies = [r["latency"] for r in results if r["ok"]]
+    ttfts = [r["ttft"] for r in results if r["ok"] and r["ttft"] is not None]
+    frames = [r["frames"] for r in results if r["ok"] and r["frames"] is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            errors[str(r["status"])] = errors.get(str(r["status"]), 0) + 1
+    
+    return {
+        "scenario": name,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "ttft_p50_ms": percentile(ttfts, 50) * 1000 if ttfts else None,
+        "ttft_p99_ms": percentile(ttfts, 99) * 1000 if ttfts else None,
+        "frames_avg": sum(frames) / len(frames) if frames else None,
+    }
+
+
+def start_process(cmd: List[str], env: Dict[str, str]) -> subprocess.Popen:
+    return subprocess.Popen(cmd, cwd=REPO_ROOT, env=dict(os.environ, **env),
+                            stdout=subprocess.DEVNULL, stderr=None)
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process exited with code {process.returncode} before becoming ready: {url}")
+        try:
+            if httpx.get(url, timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def print_report(results: List[Dict]):
+    columns = ["scenario", "requests", "throughput_rps", "p50_ms", "p99_ms", "ttft_p50_ms", "ttft_p99_ms",
+               "frames_avg", "rss_mb", "peak_rss_mb", "errors"]
+    rows = []
+    for result in results:
+        row = []
+        for column in columns:
+            value = result.get(column)
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            elif isinstance(value, dict):
+                value = ",".join(f"{k}:{v}" for k, v in value.items()) or "0"
+            row.append("-" if value is None else str(value))
+        rows.append(row)
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark the ADK middleware against a fake ADK server")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma separated scenarios to run ({', '.join(SCENARIOS)})")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent in-flight requests")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--users", type=int, default=50, help="Distinct user ids (and thus ADK sessions)")
+    parser.add_argument("--inline-image-kb", type=int, default=64, help="Size of the data URL image in multimodal scenarios")
+    parser.add_argument("--model", default="agent")
+    parser.add_argument("--api-key", default="")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--middleware-port", type=int, default=18080)
+    parser.add_argument("--adk-port", type=int, default=18001)
+    parser.add_argument("--middleware-url", default="",
+                        help="Benchmark an already running middleware instead of starting one")
+    parser.add_argument("--json", dest="json_output", default="", help="Also write results to this JSON file")
+    return parser
+
+
+def main():
+    args, fake_adk_args = build_parser().parse_known_args()
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in scenarios if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+    
+    adk_url = f"http://127.0.0.1:{args.adk_port}"
+    processes = []
+    try:
+        fake_adk = start_process(
+            [sys.executable, "-m", "benchmarks.fake_adk", "--port", str(args.adk_port), *fake_adk_args], {}
+        )
+        processes.append(fake_adk)
+        wait_until_ready(f"{adk_url}/health", fake_adk)
+        
+        middleware_pid = None
+        if not args.middleware_url:
+            args.middleware_url = f"http://127.0.0.1:{args.middleware_port}"
+            middleware = start_process(
+                [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1",
+                 "--port", str(args.middleware_port), "--log-level", "warning"],
+                {"ADK_HOST": adk_url, "ADK_APP_NAME": args.model, "LOG_LEVEL": "WARNING"}
+            )
+            processes.append(middleware)
+            middleware_pid = middleware.pid
+            wait_until_ready(f"{args.middleware_url}/v1/health", middleware)
+        
+        image = make_png(args.inline_image_kb)
+        image_data_url = "data:image/png;base64," + base64.b64encode(image).decode("ascii")
+        image_url = f"{adk_url}/files/image.png"
+        
+        results = []
+        for name in scenarios:
+            result = asyncio.run(run_scenario(name, args, image_data_url, image_url))
+            if middleware_pid:
+                result.update(read_rss_mb(middleware_pid))
+            results.append(result)
+        
+        print_report(results)
+        if args.json_output:
+            with open(args.json_output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from app.admission import AdmissionController
+from app.errors import ADKOverloadedError, ADKQueueTimeoutError
+
+
+def controller(max_in_flight: int = 1, max_queue: int = 10, queue_timeout: float = 1) -> AdmissionController:
+    return AdmissionController(max_in_flight, max_queue, queue_timeout, retry_after=2)
+
+
+async def hold(admission: AdmissionController, key: str, release: asyncio.Event, log: list, name: str):
+    async with admission.slot(key):
+        log.append(name)
+        await release.wait()
+
+
+def test_release_hands_the_slot_to_the_next_waiter():
+    async def run():
+        admission = controller()
+        first_done, second_done = asyncio.Event(), asyncio.Event()
+        log = []
+        first = asyncio.create_task(hold(admission, "app", first_done, log, "first"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(hold(admission, "app", second_done, log, "second"))
+        await asyncio.sleep(0)
+        assert log == ["first"]
+        assert admission.stats() == {"app": {"in_flight": 1, "queued": 1}}
+        
+        first_done.set()
+        await first
+        await asyncio.sleep(0)
+        # The slot moved to the waiter without being freed in between
+        assert log == ["first", "second"]
+        assert admission.stats() == {"app": {"in_flight": 1, "queued": 0}}
+        
+        second_done.set()
+        await second
+        assert admission.stats() == {}
+    
+    asyncio.run(run())
+
+
+def test_full_queue_is_rejected():
+    async def run():
+        admission = controller(max_queue=1)
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(admission, "app", release, [], str(i))) for i in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(ADKOverloadedError) as error:
+            async with admission.slot("app"):
+                pass
+        assert error.value.status_code == 429
+        assert error.value.retry_after == 2
+        release.set()
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(run())
+
+
+def test_queue_timeout():
+    async def run():
+        admission = controller(queue_timeout=0.01)
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, "app", release, [], "holder"))
+        await asyncio.sleep(0)
+        with pytest.raises(ADKQueueTimeoutError) as error:
+            async with admission.slot("app"):
+                pass
+        assert error.value.status_code == 503
+        assert admission.stats() == {"app": {"in_flight": 1, "queued": 0}}
+        release.set()
+        await holder
+        assert admission.stats() == {}
+    
+    asyncio.run(run())
+
+
+def test_waiter_cancelled_after_being_handed_a_slot_passes_it_on():
+    async def run():
+        # Without a timeout the waiter awaits its future directly, so the
+        # cancellation reaches it after the hand-off on every Python version
+        admission = controller(queue_timeout=0)
+        state = await admission._acquire("app")
+        cancelled = asyncio.create_task(admission._acquire("app"))
+        third = asyncio.create_task(admission._acquire("app"))
+        await asyncio.sleep(0)
+        
+        # Hand the slot to `cancelled`, then cancel it before it wakes up
+        admission._release("app", state)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        await asyncio.sleep(0)
+        
+        assert cancelled.cancelled()
+        assert third.done() and third.result() is state
+        assert admission.stats() == {"app": {"in_flight": 1, "queued": 0}}
+        admission._release("app", state)
+        assert admission.stats() == {}
+    
+    asyncio.run(run())
+
+
+def test_single_slot_runs_calls_in_arrival_order():
+    async def run():
+        admission = controller()
+        log = []
+        
+        async def call(name: str):
+            async with admission.slot("session"):
+                log.append(f"start {name}")
+                await asyncio.sleep(0)
+                log.append(f"end {name}")
+        
+        await asyncio.gather(*(call(str(i)) for i in range(4)))
+        assert log == [f"{step} {i}" for i in range(4) for step in ("start", "end")]
+    
+    asyncio.run(run())
+
+
+def test_keys_are_independent():
+    async def run():
+        admission = controller()
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(admission, "a", release, [], "a"))
+        await asyncio.sleep(0)
+        async with admission.slot("b"):
+            assert admission.stats() == {"a": {"in_flight": 1, "queued": 0}, "b": {"in_flight": 1, "queued": 0}}
+        release.set()
+        await holder
+    
+    asyncio.run(run())
+
+
+def test_disabled_controller_does_not_track_calls():
+    async def run():
+        admission = controller(max_in_flight=0)
+        async with admission.slot("app"), admission.slot("app"):
+            assert admission.stats() == {}
+    
+    asyncio.run(run())
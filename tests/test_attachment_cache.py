@@ -0,0 +1,132 @@
+import asyncio
+import os
+import time
+from email.utils import formatdate
+
+import httpx
+import pytest
+
+from app import multimodal
+from app.attachment_cache import AttachmentCache, CachedAttachment
+from app.multimodal import MultimodalProcessor
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 64
+
+
+def entry(size: int, **kwargs) -> CachedAttachment:
+    return CachedAttachment(mime_type="image/png", data="A" * size, **kwargs)
+
+
+@pytest.mark.parametrize("headers, ttl", [
+    ({"cache-control": "public, max-age=120"}, 120),
+    ({"cache-control": "max-age=0"}, 0),
+    ({"expires": formatdate(time.time() + 300, usegmt=True)}, 300),
+])
+def test_cacheable_responses(headers, ttl):
+    expires_at = AttachmentCache(1024).freshness_from_headers(httpx.Headers(headers))
+    assert expires_at == pytest.approx(time.time() + ttl, abs=5)
+
+
+@pytest.mark.parametrize("headers", [
+    {"cache-control": "no-store"},
+    {"cache-control": "private, max-age=600"},
+    {},
+    {"content-type": "image/png"},
+])
+def test_responses_that_must_not_be_cached(headers):
+    assert AttachmentCache(1024).freshness_from_headers(httpx.Headers(headers)) is None
+
+
+@pytest.mark.parametrize("headers", [
+    {"cache-control": "no-cache"},
+    {"etag": '"v1"'},
+    {"last-modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+    {"expires": "not a date"},
+])
+def test_responses_cached_only_for_revalidation(headers):
+    assert AttachmentCache(1024).freshness_from_headers(httpx.Headers(headers)) < time.time()
+
+
+def test_default_ttl_opts_into_caching_responses_without_headers():
+    expires_at = AttachmentCache(1024, default_ttl=60).freshness_from_headers(httpx.Headers({}))
+    assert expires_at == pytest.approx(time.time() + 60, abs=5)
+
+
+def test_stale_entry_is_revalidated_with_its_etag(monkeypatch):
+    requests = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"cache-control": "max-age=60"})
+        return httpx.Response(200, content=PNG, headers={"content-type": "image/png", "etag": '"v1"'})
+    
+    real_client = httpx.AsyncClient
+    monkeypatch.setattr(multimodal.httpx, "AsyncClient",
+                        lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+    processor = MultimodalProcessor()
+    processor.attachment_cache = AttachmentCache(1024 * 1024)
+    
+    async def fetch():
+        return await processor._download_and_convert_url("http://files.test/image.png")
+    
+    first = asyncio.run(fetch())
+    second = asyncio.run(fetch())
+    third = asyncio.run(fetch())
+    
+    assert first.data == second.data == third.data
+    # The ETag-only response is revalidated, then reused for the max-age of the 304
+    assert len(requests) == 2
+    assert "if-none-match" not in requests[0].headers
+    assert requests[1].headers["if-none-match"] == '"v1"'
+
+
+def test_eviction_is_byte_bounded_and_least_recently_used():
+    async def run():
+        cache = AttachmentCache(max_bytes=300)
+        await cache.put("a", entry(100))
+        await cache.put("b", entry(100))
+        await cache.put("c", entry(100))
+        assert await cache.get("a") is not None  # "b" is now the oldest
+        await cache.put("d", entry(100))
+        
+        assert await cache.get("b") is None
+        for key in "acd":
+            assert await cache.get(key) is not None
+        assert cache.stats()["bytes"] == 300
+        
+        await cache.put("huge", entry(301))
+        assert await cache.get("huge") is None
+    
+    asyncio.run(run())
+
+
+def test_evicted_entries_spill_to_disk_and_reload(tmp_path):
+    spill_dir = str(tmp_path)
+    
+    async def run():
+        cache = AttachmentCache(max_bytes=100, spill_dir=spill_dir, spill_max_bytes=10 ** 6)
+        await cache.put("a", entry(100, etag='"a"', expires_at=time.time() + 60))
+        await cache.put("b", entry(100))
+        assert cache.stats()["spilled_entries"] == 1
+        assert len(os.listdir(spill_dir)) == 1
+        
+        # A new instance (e.g. after a restart) picks up the spilled entry
+        reloaded = AttachmentCache(max_bytes=100, spill_dir=spill_dir, spill_max_bytes=10 ** 6)
+        assert reloaded.stats()["spilled_entries"] == 1
+        restored = await reloaded.get("a")
+        assert restored.etag == '"a"' and restored.size == 100 and restored.is_fresh()
+        assert reloaded.stats()["spilled_entries"] == 0
+    
+    asyncio.run(run())
+
+
+def test_spill_directory_is_size_bounded(tmp_path):
+    async def run():
+        cache = AttachmentCache(max_bytes=100, spill_dir=str(tmp_path), spill_max_bytes=500)
+        for key in "abcdef":
+            await cache.put(key, entry(100, expires_at=time.time() + 60))
+        assert cache.stats()["spilled_bytes"] <= 500
+        assert len(os.listdir(tmp_path)) == cache.stats()["spilled_entries"] < 5
+    
+    asyncio.run(run())
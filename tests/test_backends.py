@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.backends import LEAST_OUTSTANDING, BackendPool
+
+URLS = ["http://adk-a:8000", "http://adk-b:8000", "http://adk-c:8000"]
+KEYS = [f"agent:user{i}:session{i}" for i in range(300)]
+
+
+def routes(pool: BackendPool) -> dict:
+    return {key: pool.select(key).url for key in KEYS}
+
+
+def test_same_key_routes_to_the_same_backend():
+    pool = BackendPool(URLS)
+    assert routes(pool) == routes(pool)
+    # Placement depends only on the URLs, so it survives restarts
+    assert routes(pool) == routes(BackendPool(URLS))
+    # Keys are spread over every replica
+    assert set(routes(pool).values()) == set(URLS)
+
+
+def test_ejecting_a_backend_remaps_only_its_keys():
+    pool = BackendPool(URLS)
+    before = routes(pool)
+    ejected = pool.backends[1]
+    ejected.healthy = False
+    after = routes(pool)
+    
+    for key in KEYS:
+        if before[key] == ejected.url:
+            assert after[key] != ejected.url
+        else:
+            assert after[key] == before[key]
+    
+    ejected.healthy = True
+    assert routes(pool) == before
+
+
+def test_open_circuit_ejects_a_backend():
+    pool = BackendPool(URLS, failure_threshold=1)
+    key = next(key for key in KEYS if pool.select(key) is pool.backends[0])
+    pool.backends[0].circuit_breaker.record_failure()
+    assert not pool.backends[0].available
+    assert pool.select(key) is not pool.backends[0]
+
+
+def test_health_checks_eject_and_readmit(monkeypatch):
+    healthy = {"http://adk-a:8000": True, "http://adk-b:8000": True}
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        if not healthy[f"{request.url.scheme}://{request.url.host}:{request.url.port}"]:
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(200, json=["agent"])
+    
+    pool = BackendPool(list(healthy), unhealthy_threshold=2)
+    backend = pool.backends[0]
+    
+    async def check():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            await pool._check(client, backend, timeout=1)
+    
+    healthy[backend.url] = False
+    asyncio.run(check())
+    assert backend.available  # One failure is tolerated
+    asyncio.run(check())
+    assert not backend.available
+    
+    healthy[backend.url] = True
+    asyncio.run(check())
+    assert backend.available
+    assert backend.health_failures == 0
+
+
+@pytest.mark.parametrize("strategy", ["consistent_hash", LEAST_OUTSTANDING])
+def test_routing_still_returns_a_backend_when_all_are_ejected(strategy):
+    pool = BackendPool(URLS, strategy=strategy)
+    for backend in pool.backends:
+        backend.healthy = False
+    for key in KEYS[:20]:
+        assert pool.select(key) in pool.backends
+
+
+def test_least_outstanding_prefers_idle_available_backends():
+    pool = BackendPool(URLS, strategy=LEAST_OUTSTANDING)
+    busy, idle, ejected = pool.backends
+    ejected.healthy = False
+    with pool.track(busy):
+        assert pool.select("any") is idle
+        with pool.track(idle), pool.track(idle):
+            assert pool.select("any") is busy
+    assert busy.outstanding == idle.outstanding == 0
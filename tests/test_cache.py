@@ -0,0 +1,78 @@
+import pytest
+
+from app import cache
+from app.cache import LRUCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for TTL expiry."""
+    class Clock:
+        now = 100.0
+    
+    monkeypatch.setattr(cache.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def test_size_is_bounded_and_least_recently_used_is_evicted():
+    lru = LRUCache(max_size=3)
+    for key in "abc":
+        lru.set(key, key.upper())
+    assert lru.get("a") == "A"  # "b" is now the oldest
+    lru.set("d", "D")
+    
+    assert len(lru) == 3
+    assert lru.get("b") is None
+    assert [lru.get(key) for key in "acd"] == ["A", "C", "D"]
+    assert lru.stats()["evictions"] == 1
+
+
+def test_setting_an_existing_key_refreshes_it():
+    lru = LRUCache(max_size=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.set("a", 3)
+    lru.set("c", 4)
+    assert lru.get("a") == 3
+    assert lru.get("b") is None
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = LRUCache(max_size=10, ttl=30)
+    lru.set("a")
+    clock.now += 29
+    assert lru.get("a") is True
+    clock.now += 1
+    assert lru.get("a", "missing") == "missing"
+    assert len(lru) == 0
+    assert lru.stats()["expirations"] == 1
+
+
+def test_set_restarts_the_ttl(clock):
+    lru = LRUCache(max_size=10, ttl=30)
+    lru.set("a")
+    clock.now += 20
+    lru.set("a")
+    clock.now += 20
+    assert lru.get("a") is True
+
+
+def test_zero_ttl_never_expires(clock):
+    lru = LRUCache(max_size=10, ttl=0)
+    lru.set("a")
+    clock.now += 10 ** 9
+    assert lru.get("a") is True
+
+
+def test_stats_report_hit_ratio():
+    lru = LRUCache(max_size=10)
+    lru.set("a")
+    lru.get("a")
+    lru.get("a")
+    lru.get("b")
+    lru.discard("a")
+    lru.get("a")
+    assert lru.stats() == {
+        "size": 0, "max_size": 10, "hits": 2, "misses": 2,
+        "evictions": 0, "expirations": 0, "hit_ratio": 0.5
+    }
@@ -0,0 +1,72 @@
+import pytest
+
+from app.adk_client import ADKClient
+from app.delta import DUPLICATE, EXTENSION, FIRST, MESSAGE, PARTIAL, TURN_SEPARATOR, StreamDeltaTracker
+
+
+def text_event(event_id: str, text: str, partial: bool = False) -> dict:
+    event = {"id": event_id, "author": "agent", "content": {"role": "model", "parts": [{"text": text}]}}
+    if partial:
+        event["partial"] = True
+    return event
+
+
+def stream_text(events) -> str:
+    client = ADKClient()
+    tracker = StreamDeltaTracker()
+    deltas = (client._convert_adk_event_to_delta(event, tracker) for event in events)
+    return "".join(piece for piece in deltas if piece)
+
+
+def test_narration_tool_call_and_short_answer_are_all_forwarded():
+    events = [
+        text_event("e1", "Let me look up the current weather in Paris for you."),
+        {"id": "e2", "author": "agent", "content": {"role": "model", "parts": [
+            {"functionCall": {"name": "get_weather", "args": {"city": "Paris"}}}
+        ]}},
+        {"id": "e3", "author": "agent", "content": {"role": "user", "parts": [
+            {"functionResponse": {"name": "get_weather", "response": {"temperature": 22}}}
+        ]}},
+        text_event("e4", "It is 22°C and sunny."),
+    ]
+    assert stream_text(events) == (
+        "Let me look up the current weather in Paris for you." + TURN_SEPARATOR + "It is 22°C and sunny."
+    )
+
+
+def test_aggregated_event_after_partials_is_not_repeated():
+    events = [
+        text_event("p1", "It is ", partial=True),
+        text_event("p2", "22°C", partial=True),
+        text_event("p3", " and sunny.", partial=True),
+        text_event("final", "It is 22°C and sunny."),
+    ]
+    assert stream_text(events) == "It is 22°C and sunny."
+
+
+def test_partial_turns_after_a_tool_call_start_a_new_message():
+    events = [
+        text_event("p1", "Checking", partial=True),
+        text_event("a1", "Checking"),
+        text_event("p2", "Done", partial=True),
+        text_event("p3", ".", partial=True),
+        text_event("a2", "Done."),
+    ]
+    assert stream_text(events) == "Checking" + TURN_SEPARATOR + "Done."
+
+
+def test_repeated_event_is_skipped():
+    event = text_event("e1", "Hello")
+    assert stream_text([event, event]) == "Hello"
+
+
+@pytest.mark.parametrize("content, expected", [
+    ("It is 22°C", (DUPLICATE, "")),
+    ("It is 22°C and sunny.", (EXTENSION, " and sunny.")),
+])
+def test_feed_actions(content, expected):
+    tracker = StreamDeltaTracker()
+    assert tracker.feed("It is ", partial=True) == (FIRST, "It is ")
+    assert tracker.feed("22°C", partial=True) == (PARTIAL, "22°C")
+    assert tracker.feed(content) == expected
+    assert tracker.feed("Next turn") == (MESSAGE, TURN_SEPARATOR + "Next turn")
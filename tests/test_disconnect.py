@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app import main
+from app.config import settings
+
+
+async def call_and_disconnect(body: dict, upstream_started: asyncio.Event) -> list:
+    """Send a chat completion through the ASGI app; the client disconnects once ADK is called."""
+    raw_body = json.dumps(body).encode()
+    sent = []
+    body_sent = False
+    
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": raw_body, "more_body": False}
+        await upstream_started.wait()
+        return {"type": "http.disconnect"}
+    
+    async def send(message):
+        sent.append(message)
+    
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": "/v1/chat/completions",
+        "raw_path": b"/v1/chat/completions",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(raw_body)).encode()),
+            (b"authorization", f"Bearer {settings.default_api_key}".encode()),
+        ],
+        "client": ("testclient", 50000),
+        "server": ("testserver", 80),
+    }
+    await asyncio.wait_for(main.app(scope, receive, send), 5)
+    return sent
+
+
+@pytest.mark.parametrize("stream, path", [(False, "/run"), (True, "/run_sse")])
+def test_client_disconnect_cancels_the_adk_run(monkeypatch, stream, path):
+    monkeypatch.setattr(settings, "adk_stream_mode", "sse")
+    cancelled = []
+    
+    async def run():
+        upstream_started = asyncio.Event()
+        
+        async def handler(request: httpx.Request) -> httpx.Response:
+            if request.url.path in ("/run", "/run_sse"):
+                upstream_started.set()
+                try:
+                    await asyncio.sleep(30)
+                except asyncio.CancelledError:
+                    cancelled.append(request.url.path)
+                    raise
+            return httpx.Response(200, json={})
+        
+        monkeypatch.setattr(main.adk_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+        body = {"model": "agent", "stream": stream, "messages": [{"role": "user", "content": "hi"}]}
+        return await call_and_disconnect(body, upstream_started)
+    
+    sent = asyncio.run(run())
+    assert sent[0]["type"] == "http.response.start"
+    assert sent[0]["status"] == main.CLIENT_CLOSED_REQUEST
+    assert cancelled == [path]
+    # Slots taken for the run are released
+    assert main.adk_client.admission.stats() == {}
+    assert main.adk_client.session_queue.stats() == {}
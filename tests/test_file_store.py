@@ -0,0 +1,108 @@
+import asyncio
+import base64
+import hashlib
+import os
+import time
+
+import pytest
+
+from app.file_store import FileStore
+
+PAYLOAD = b"\x89PNG\r\n\x1a\n" + bytes(range(256))
+
+
+def store_bytes(store: FileStore, data: bytes, filename: str = "image.png") -> str:
+    writer = store.create_writer()
+    writer.hash(data)
+    writer.write(base64.b64encode(data).decode("ascii"))
+    return asyncio.run(store.commit(writer, "image/png", filename, len(data)))
+
+
+def age(path: str, seconds: float):
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+@pytest.fixture
+def store(tmp_path) -> FileStore:
+    return FileStore(root_dir=str(tmp_path), ttl=3600)
+
+
+def test_commit_and_resolve_round_trip(store):
+    handle = store_bytes(store, PAYLOAD)
+    assert handle == f"adkfile://{hashlib.sha256(PAYLOAD).hexdigest()}"
+    
+    inline = asyncio.run(store.resolve(handle))
+    assert inline.mimeType == "image/png"
+    assert base64.b64decode(inline.data) == PAYLOAD
+
+
+def test_identical_content_is_stored_once(store, tmp_path):
+    first = store_bytes(store, PAYLOAD, "a.png")
+    second = store_bytes(store, PAYLOAD, "b.png")
+    assert first == second
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{first[len('adkfile://'):]}{ext}" for ext in (".b64", ".json"))
+
+
+@pytest.mark.parametrize("handle", [
+    "adkfile://../../etc/passwd",
+    "adkfile://" + "A" * 64,
+    "adkfile://" + "a" * 63,
+    "adkfile://" + "a" * 64 + "/../x",
+    "file:///etc/passwd",
+    "adkfile://" + "a" * 64,  # Well-formed but unknown
+])
+def test_invalid_or_unknown_handles_resolve_to_none(store, handle):
+    store_bytes(store, PAYLOAD)
+    assert asyncio.run(store.resolve(handle)) is None
+
+
+def test_gc_removes_expired_entries_and_keeps_fresh_ones(store, tmp_path):
+    expired = store_bytes(store, PAYLOAD)[len("adkfile://"):]
+    fresh = store_bytes(store, PAYLOAD + b"fresh")[len("adkfile://"):]
+    for ext in (".b64", ".json"):
+        age(os.path.join(tmp_path, expired + ext), 7200)
+    
+    assert store.collect_garbage() == 1
+    assert sorted(os.listdir(tmp_path)) == [fresh + ".b64", fresh + ".json"]
+    assert asyncio.run(store.resolve(f"adkfile://{expired}")) is None
+
+
+def test_expired_entry_is_not_served_before_gc(store, tmp_path):
+    handle = store_bytes(store, PAYLOAD)
+    age(os.path.join(tmp_path, handle[len("adkfile://"):] + ".json"), 7200)
+    assert asyncio.run(store.resolve(handle)) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_gc_removes_orphaned_payloads_and_temp_files(store, tmp_path):
+    digest = store_bytes(store, PAYLOAD)[len("adkfile://"):]
+    # Crash after the payload was renamed into place, before its metadata was written
+    os.remove(os.path.join(tmp_path, digest + ".json"))
+    orphan = os.path.join(tmp_path, digest + ".b64")
+    leftover = store.create_writer()
+    leftover.close()
+    
+    assert store.collect_garbage() == 0  # Younger than the TTL
+    age(orphan, 7200)
+    age(leftover.path, 7200)
+    assert store.collect_garbage() == 1
+    assert os.listdir(tmp_path) == []
+
+
+def test_reupload_revives_an_orphaned_payload(store, tmp_path):
+    digest = store_bytes(store, PAYLOAD)[len("adkfile://"):]
+    os.remove(os.path.join(tmp_path, digest + ".json"))
+    age(os.path.join(tmp_path, digest + ".b64"), 7200)
+    
+    handle = store_bytes(store, PAYLOAD)
+    assert store.collect_garbage() == 0
+    assert asyncio.run(store.resolve(handle)) is not None
+
+
+def test_gc_is_disabled_without_ttl(tmp_path):
+    store = FileStore(root_dir=str(tmp_path), ttl=0)
+    digest = store_bytes(store, PAYLOAD)[len("adkfile://"):]
+    age(os.path.join(tmp_path, digest + ".json"), 10 ** 6)
+    assert store.collect_garbage() == 0
+    assert asyncio.run(store.resolve(f"adkfile://{digest}")) is not None
@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+import logging.handlers
+import queue
+
+import pytest
+
+from app.logging_config import JsonFormatter, LOG_FORMAT, _QueueHandler
+
+
+def log_through_queue(formatter: logging.Formatter, log):
+    """Emit records the way setup_logging does with LOG_ASYNC, return the written output."""
+    output = io.StringIO()
+    target = logging.StreamHandler(output)
+    target.setFormatter(formatter)
+    log_queue: queue.Queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, target)
+    logger = logging.getLogger("tests.logging_config")
+    logger.propagate = False
+    logger.addHandler(_QueueHandler(log_queue))
+    listener.start()
+    try:
+        log(logger)
+    finally:
+        listener.stop()
+        logger.handlers.clear()
+    return output.getvalue()
+
+
+def fail(logger: logging.Logger):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Request %s failed", 42)
+
+
+def test_json_exception_is_a_separate_field():
+    entry = json.loads(log_through_queue(JsonFormatter(), fail))
+    assert entry["message"] == "Request 42 failed"
+    assert entry["level"] == "ERROR"
+    assert entry["exception"].startswith("Traceback")
+    assert "ValueError: boom" in entry["exception"]
+
+
+@pytest.mark.parametrize("formatter", [JsonFormatter(), logging.Formatter(LOG_FORMAT)])
+def test_record_without_exception(formatter):
+    output = log_through_queue(formatter, lambda logger: logger.warning("Slow call: %.1fs", 2.5))
+    assert output.count("Slow call: 2.5s") == 1
+    assert "Traceback" not in output
+
+
+def test_text_format_keeps_the_traceback_once():
+    output = log_through_queue(logging.Formatter(LOG_FORMAT), fail)
+    assert "Request 42 failed\nTraceback" in output
+    assert output.count("ValueError: boom") == 1
@@ -0,0 +1,68 @@
+import asyncio
+import base64
+
+import pytest
+
+from app import multimodal
+from app.config import settings
+from app.offload import map_slices
+
+
+@pytest.fixture
+def small_slices(monkeypatch):
+    """Slice every payload into a few characters, so short test data takes the sliced path."""
+    monkeypatch.setattr(settings, "cpu_offload_threshold_kb", 0)
+    monkeypatch.setattr(multimodal, "_BASE64_SLICE_CHARS", 8)
+
+
+def test_map_slices_yields_to_the_event_loop_between_slices(monkeypatch):
+    monkeypatch.setattr(settings, "cpu_offload_threshold_kb", 0)
+    ticks = []
+    
+    async def ticker():
+        while True:
+            ticks.append(len(ticks))
+            await asyncio.sleep(0)
+    
+    async def run():
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        results = await map_slices(bytes, b"abcdefghij", 2)
+        task.cancel()
+        return results
+    
+    assert asyncio.run(run()) == [b"ab", b"cd", b"ef", b"gh", b"ij"]
+    assert len(ticks) >= 5
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "QUJDREVGR0hJSg==",
+    "QUJD\nREVG\r\nR0hJ SktM\n",
+    "QUJDREVGR0hJSh==",
+    "QUJDREVGR0hJSktMTU5PUFFSU1RVVg=\n=",
+])
+def test_normalize_matches_decode_and_reencode(small_slices, text):
+    expected = base64.b64encode(base64.b64decode(text)).decode()
+    assert asyncio.run(multimodal._normalize_base64(text)) == expected
+
+
+@pytest.mark.parametrize("text, canonical", [
+    ("", True),
+    ("QUJDRA==", True),
+    ("QUJDREVGR0hJSg==", True),
+    ("QUJD\nREVG", False),
+    ("QUJDRA=", False),
+    ("QUI=QUJD", False),
+    ("QUJDREVG=AAAAAAA", False),
+    ("QUJDREVGR0hJSg", False),
+    ("QUJDREVGR0hJ√g==", False),
+])
+def test_canonical_check_is_slice_safe(small_slices, text, canonical):
+    assert asyncio.run(multimodal._is_canonical_base64(text)) is canonical
+
+
+@pytest.mark.parametrize("text", ["QUJDREVGR0hJSg", "QUJDRE", "QUJD\u221aREVG"])
+def test_normalize_keeps_decode_errors(small_slices, text):
+    with pytest.raises(ValueError):
+        asyncio.run(multimodal._normalize_base64(text))
@@ -0,0 +1,119 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app import resilience
+from app.adk_client import ADKClient
+from app.config import settings
+from app.errors import CircuitOpenError
+from app.models import ChatCompletionRequest
+from app.resilience import CircuitBreaker
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the circuit breaker."""
+    class Clock:
+        now = 1000.0
+    
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: Clock.now)
+    return Clock
+
+
+def open_breaker() -> CircuitBreaker:
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10)
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=10)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()  # Resets the count
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.rejecting
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(10)
+
+
+def test_half_open_probe_success_closes(clock):
+    breaker = open_breaker()
+    clock.now += 10
+    assert not breaker.rejecting
+    
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time
+    assert breaker.rejecting
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+    breaker.before_call()
+
+
+def test_half_open_probe_failure_reopens(clock):
+    breaker = open_breaker()
+    clock.now += 10
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    
+    clock.now += 5
+    with pytest.raises(CircuitOpenError) as error:
+        breaker.before_call()
+    assert error.value.retry_after == pytest.approx(5)
+
+
+def test_lost_probe_is_replaced_after_reset_timeout(clock):
+    breaker = open_breaker()
+    clock.now += 10
+    breaker.before_call()  # Probe that never reports back
+    clock.now += 10
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_disabled_breaker_never_opens(clock):
+    breaker = CircuitBreaker("test", failure_threshold=0, reset_timeout=10)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+@pytest.mark.parametrize("outage", ["connect_error", "503"])
+def test_one_request_retrying_through_an_outage_does_not_open_the_circuit(monkeypatch, outage):
+    attempts = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        attempts.append(request.url.path)
+        if outage == "connect_error":
+            raise httpx.ConnectError("connection refused", request=request)
+        return httpx.Response(503, text="unavailable")
+    
+    client = ADKClient()
+    monkeypatch.setattr(client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(client.retry_policy, "delay", lambda attempt: 0)
+    request = ChatCompletionRequest(model="agent", messages=[{"role": "user", "content": "hi"}])
+    
+    with pytest.raises((httpx.ConnectError, httpx.HTTPStatusError)):
+        asyncio.run(client.create_chat_completion(request))
+    
+    # Session creation and /run were each retried up to the attempt limit
+    assert len(attempts) == 2 * settings.adk_retry_max_attempts
+    breaker = client.backends.backends[0].circuit_breaker
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 2
@@ -0,0 +1,81 @@
+import json
+import random
+
+import pytest
+
+from app.serialization import JSONArrayParser
+
+
+def random_value(rng: random.Random, depth: int = 0):
+    kind = rng.choice(["int", "float", "exp", "str", "bool", "null", "list", "dict"] if depth < 3 else
+                      ["int", "float", "exp", "str", "bool", "null"])
+    if kind == "int":
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == "float":
+        return round(rng.uniform(-1000, 1000), rng.randint(1, 6))
+    if kind == "exp":
+        return rng.uniform(-1, 1) * 10 ** rng.randint(-30, 30)
+    if kind == "str":
+        return "".join(rng.choice('ab ,[]{}"\\\n中文✓é') for _ in range(rng.randint(0, 20)))
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "null":
+        return None
+    if kind == "list":
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randint(0, 4))}
+
+
+def split(data: bytes, rng: random.Random):
+    """Cut `data` at random byte offsets, including inside multi-byte characters."""
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(1, 8)
+        yield data[pos:pos + size]
+        pos += size
+
+
+def parse_chunks(chunks):
+    parser = JSONArrayParser()
+    elements = []
+    for chunk in chunks:
+        elements.extend(parser.feed(chunk))
+    elements.extend(parser.close())
+    return parser, elements
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_chunk_split_round_trip(seed):
+    rng = random.Random(seed)
+    value = [random_value(rng) for _ in range(rng.randint(0, 12))]
+    body = json.dumps(value, ensure_ascii=rng.random() < 0.5, indent=rng.choice([None, 1])).encode("utf-8")
+    
+    parser, elements = parse_chunks(split(body, rng))
+    
+    assert parser.is_array
+    assert elements == json.loads(body)
+
+
+@pytest.mark.parametrize("chunks, expected", [
+    ([b"[1.", b"5]"], [1.5]),
+    ([b"[1.5e", b"10]"], [1.5e10]),
+    ([b"[2E", b"+3, -", b"4]"], [2e3, -4]),
+    ([b"[1", b"2", b"3]"], [123]),
+    ([b" [ ", b"] "], []),
+])
+def test_numbers_split_across_chunks(chunks, expected):
+    assert parse_chunks(chunks)[1] == expected
+
+
+@pytest.mark.parametrize("body", [b'{"a": 1}', b'"text"', b"42"])
+def test_non_array_value_is_returned_whole(body):
+    parser, elements = parse_chunks([body[:2], body[2:]])
+    
+    assert not parser.is_array
+    assert elements == [json.loads(body)]
+
+
+@pytest.mark.parametrize("body", [b"", b"[1,", b"[1 2]", b"[1]x", b'[{"a": 1}', b"[1,]", b"[1.]"])
+def test_malformed_input_raises(body):
+    with pytest.raises(ValueError):
+        parse_chunks([body[i:i + 2] for i in range(0, len(body), 2)])
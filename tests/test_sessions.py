@@ -0,0 +1,171 @@
+import asyncio
+import hashlib
+import json
+import re
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import main
+from app.adk_client import ADKClient
+from app.config import settings
+from app.models import ChatCompletionRequest
+
+
+def session_posts(requests: list) -> list:
+    return [request for request in requests if request.method == "POST" and request.url.path.endswith("/sessions")]
+
+
+def adk_client(monkeypatch, handler) -> ADKClient:
+    client = ADKClient()
+    monkeypatch.setattr(client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(client.retry_policy, "max_attempts", 1)
+    return client
+
+
+def test_concurrent_requests_for_one_session_create_it_once(monkeypatch):
+    requests = []
+    
+    async def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        await asyncio.sleep(0.01)  # Keep the creation in flight while the others arrive
+        return httpx.Response(200, json={"id": "s1"})
+    
+    client = adk_client(monkeypatch, handler)
+    backend = client.backends.backends[0]
+    
+    async def run():
+        await asyncio.gather(*(client._ensure_session(backend, "agent", "u1", "s1") for _ in range(20)))
+        # Later requests are served from the session cache
+        await client._ensure_session(backend, "agent", "u1", "s1")
+    
+    asyncio.run(run())
+    assert len(session_posts(requests)) == 1
+    assert client._session_inflight == {}
+
+
+def test_failed_creation_is_not_cached(monkeypatch):
+    requests = []
+    status = {"code": 500}
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(status["code"], json={})
+    
+    client = adk_client(monkeypatch, handler)
+    backend = client.backends.backends[0]
+    
+    async def run():
+        # Waiters of a failed creation all see the failure; none is cached
+        await asyncio.gather(*(client._ensure_session(backend, "agent", "u1", "s1") for _ in range(5)))
+        assert len(session_posts(requests)) == 1
+        
+        status["code"] = 200
+        await client._ensure_session(backend, "agent", "u1", "s1")
+        assert len(session_posts(requests)) == 2
+        await client._ensure_session(backend, "agent", "u1", "s1")
+        assert len(session_posts(requests)) == 2
+    
+    asyncio.run(run())
+
+
+def test_existing_session_conflict_counts_as_created(monkeypatch):
+    requests = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(409, json={"detail": "Session already exists"})
+    
+    client = adk_client(monkeypatch, handler)
+    backend = client.backends.backends[0]
+    
+    async def run():
+        for _ in range(3):
+            await client._ensure_session(backend, "agent", "u1", "s1")
+    
+    asyncio.run(run())
+    assert len(session_posts(requests)) == 1
+
+
+def chat_request(user: str = "alice", metadata: dict = None, messages: list = None) -> ChatCompletionRequest:
+    return ChatCompletionRequest(
+        model="agent", user=user, metadata=metadata,
+        messages=messages or [{"role": "user", "content": "hi"}]
+    )
+
+
+def conversation_session(user: str, conversation_id: str) -> str:
+    digest = hashlib.sha256(f"{user}\0id:{conversation_id}".encode("utf-8")).hexdigest()
+    return f"conv_{digest[:32]}"
+
+
+def test_conversation_id_is_hashed_into_the_session_id():
+    session_id = ADKClient()._session_id(chat_request(), "alice", "c1")
+    assert re.fullmatch(r"conv_[0-9a-f]{32}", session_id)
+    assert session_id == conversation_session("alice", "c1")
+
+
+def test_metadata_conversation_id_is_used_without_header():
+    request = chat_request(metadata={"conversation_id": "c1"})
+    assert ADKClient()._session_id(request, "alice", None) == conversation_session("alice", "c1")
+
+
+def test_header_takes_precedence_over_metadata():
+    request = chat_request(metadata={"conversation_id": "from-metadata"})
+    assert ADKClient()._session_id(request, "alice", "from-header") == conversation_session("alice", "from-header")
+
+
+def test_sessions_are_scoped_per_user_and_conversation():
+    client = ADKClient()
+    sessions = {
+        client._session_id(chat_request(user), user, conversation)
+        for user in ("alice", "bob") for conversation in ("c1", "c2")
+    }
+    assert len(sessions) == 4
+
+
+def test_falls_back_to_the_user_session_without_a_conversation_id():
+    assert ADKClient()._session_id(chat_request(metadata={"other": 1}), "alice", None) == "session_alice"
+
+
+def test_user_scope_ignores_the_conversation_id(monkeypatch):
+    monkeypatch.setattr(settings, "session_scope", "user")
+    assert ADKClient()._session_id(chat_request(), "alice", "c1") == "session_alice"
+
+
+def test_first_message_identifies_the_conversation_when_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "session_id_from_first_message", True)
+    client = ADKClient()
+    first_turn = chat_request(messages=[{"role": "user", "content": "plan a trip"}])
+    later_turn = chat_request(messages=[
+        {"role": "user", "content": "plan a trip"},
+        {"role": "assistant", "content": "Where to?"},
+        {"role": "user", "content": "Paris"},
+    ])
+    other = chat_request(messages=[{"role": "user", "content": "write a poem"}])
+    
+    session_id = client._session_id(first_turn, "alice", None)
+    assert session_id.startswith("conv_")
+    assert client._session_id(later_turn, "alice", None) == session_id
+    assert client._session_id(other, "alice", None) != session_id
+
+
+def test_header_reaches_the_adk_run_request(monkeypatch):
+    runs = []
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/run":
+            runs.append(json.loads(request.content))
+            return httpx.Response(200, json=[{"content": {"parts": [{"text": "ok"}]}}])
+        return httpx.Response(200, json={})
+    
+    monkeypatch.setattr(main.adk_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    response = TestClient(main.app).post(
+        "/v1/chat/completions",
+        json={"model": "agent", "user": "alice", "metadata": {"conversation_id": "from-metadata"},
+              "messages": [{"role": "user", "content": "hi"}]},
+        headers={"Authorization": f"Bearer {settings.default_api_key}",
+                 settings.session_conversation_header: "from-header"}
+    )
+    assert response.status_code == 200
+    assert runs[0]["sessionId"] == conversation_session("alice", "from-header")
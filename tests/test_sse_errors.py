@@ -0,0 +1,60 @@
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.config import settings
+from app.errors import ADKRunError
+
+
+def sse(*events) -> bytes:
+    return "".join(f"data: {json.dumps(event)}\n\n" for event in events).encode()
+
+
+def text_event(text: str) -> dict:
+    return {"author": "agent", "content": {"role": "model", "parts": [{"text": text}]}}
+
+
+@pytest.fixture
+def adk(monkeypatch):
+    """Route the ADK client to a mock backend answering /run_sse with `adk.body`."""
+    class Backend:
+        body = b""
+    
+    def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/run_sse"):
+            return httpx.Response(200, content=Backend.body, headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"id": "session"})
+    
+    monkeypatch.setattr(settings, "adk_stream_mode", "sse")
+    monkeypatch.setattr(main.adk_client, "_http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    return Backend
+
+
+def chat(client: TestClient):
+    return client.post(
+        "/v1/chat/completions",
+        json={"model": "agent", "stream": True, "messages": [{"role": "user", "content": "hi"}]},
+        headers={"Authorization": f"Bearer {settings.default_api_key}"}
+    )
+
+
+def test_error_before_any_output_is_a_502(adk):
+    adk.body = sse({"error": "model overloaded"})
+    response = chat(TestClient(main.app))
+    assert response.status_code == 502
+
+
+def test_error_in_trailing_unterminated_event_is_a_502(adk):
+    adk.body = b'data: {"error": "model overloaded"}'
+    response = chat(TestClient(main.app))
+    assert response.status_code == 502
+
+
+def test_error_mid_stream_aborts_without_finishing(adk):
+    adk.body = sse(text_event("Partial answer"), {"error": "model overloaded"})
+    # Once streaming has started the error can only abort the response
+    with pytest.raises(ADKRunError):
+        chat(TestClient(main.app))
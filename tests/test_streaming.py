@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from app.streaming import coalesce
+
+
+def test_consumer_close_closes_a_source_blocked_on_a_full_queue(monkeypatch):
+    monkeypatch.setattr("app.streaming.QUEUE_SIZE", 1)
+    released = asyncio.Event()
+    
+    async def source():
+        try:
+            while True:
+                yield "x"
+        finally:
+            # Stands in for the session/app slots and the ADK response
+            released.set()
+    
+    async def run():
+        deltas = coalesce(source(), max_bytes=1024, max_delay=0)
+        assert await deltas.__anext__() == "x"
+        await asyncio.sleep(0)  # Let the producer fill the queue and block
+        await deltas.aclose()
+        return released.is_set()
+    
+    assert asyncio.run(run())
+
+
+class Source:
+    """Source stream fed by the test; `None` ends it, an exception is raised from it."""
+    
+    def __init__(self):
+        self.queue = asyncio.Queue()
+    
+    async def stream(self):
+        while True:
+            item = await self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+async def next_within(deltas, timeout: float = 1):
+    return await asyncio.wait_for(deltas.__anext__(), timeout)
+
+
+def test_first_delta_passes_through_immediately():
+    async def run():
+        source = Source()
+        deltas = coalesce(source.stream(), max_bytes=1024, max_delay=10)
+        source.queue.put_nowait("Hel")
+        assert await next_within(deltas, 0.5) == "Hel"
+        await deltas.aclose()
+    
+    asyncio.run(run())
+
+
+def test_flushes_when_max_bytes_are_pending():
+    async def run():
+        source = Source()
+        deltas = coalesce(source.stream(), max_bytes=4, max_delay=10)
+        for piece in ["a", "bc", "dé", "f"]:
+            source.queue.put_nowait(piece)
+        assert await next_within(deltas) == "a"
+        # "é" is two bytes in UTF-8
+        assert await next_within(deltas, 0.5) == "bcdé"
+        source.queue.put_nowait(None)
+        assert await next_within(deltas) == "f"
+        with pytest.raises(StopAsyncIteration):
+            await next_within(deltas)
+    
+    asyncio.run(run())
+
+
+def test_flushes_after_max_delay():
+    async def run():
+        source = Source()
+        deltas = coalesce(source.stream(), max_bytes=1024, max_delay=0.05)
+        loop = asyncio.get_running_loop()
+        source.queue.put_nowait("a")
+        assert await next_within(deltas) == "a"
+        
+        started = loop.time()
+        source.queue.put_nowait("b")
+        source.queue.put_nowait("c")
+        assert await next_within(deltas) == "bc"
+        assert loop.time() - started >= 0.04
+        await deltas.aclose()
+    
+    asyncio.run(run())
+
+
+def test_keepalives_wait_for_keepalive_after():
+    async def run():
+        source = Source()
+        started = asyncio.Event()
+        deltas = coalesce(source.stream(), max_bytes=1024, max_delay=0, keepalive_interval=0.01,
+                          keepalive_after=started)
+        pending = asyncio.ensure_future(next_within(deltas))
+        await asyncio.sleep(0.05)
+        assert not pending.done()
+        
+        started.set()
+        assert await pending is None
+        source.queue.put_nowait("a")
+        assert await next_within(deltas) == "a"
+        await deltas.aclose()
+    
+    asyncio.run(run())
+
+
+def test_source_error_is_raised_after_pending_deltas():
+    async def run():
+        source = Source()
+        deltas = coalesce(source.stream(), max_bytes=1024, max_delay=10)
+        for item in ["a", "b", RuntimeError("ADK failed")]:
+            source.queue.put_nowait(item)
+        assert await next_within(deltas) == "a"
+        assert await next_within(deltas) == "b"
+        with pytest.raises(RuntimeError, match="ADK failed"):
+            await next_within(deltas)
+    
+    asyncio.run(run())